@@ -2,7 +2,13 @@
 Configuración del Backend
 """
 import os
-from functools import lru_cache
+import sys
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -15,11 +21,22 @@ class Settings(BaseSettings):
     supabase_url: str = ""
     supabase_key: str = ""
     supabase_bucket: str = "audio-files"
+    supabase_tus_chunk_mb: int = 8  # Chunk inicial de TUS (luego se adapta entre 1 y 32MB)
     
     # Limits
     max_duration_minutes: int = 60
     max_file_size_mb: int = 1024  # 1GB = 1024MB
     
+    # Cola de jobs en background: workers concurrentes y jobs en espera como máximo
+    job_workers: int = 4
+    job_queue_size: int = 32
+    
+    # Jobs procesándose a la vez (descarga/ffmpeg/upload); el resto espera en "pending"
+    max_concurrent_jobs: int = 3
+    
+    # Temporales de uploads: tmpfs (RAM) si hay espacio, si no /tmp/video-to-audio
+    upload_temp_dir: str = "/dev/shm/video-to-audio"
+    
     # CORS
     cors_origins: list[str] = ["http://localhost:5173", "http://localhost:3000"]
     
@@ -28,6 +45,38 @@ class Settings(BaseSettings):
         extra = "ignore"
 
 
-@lru_cache
+_settings: Optional[Settings] = None
+_log_listener: Optional[QueueListener] = None
+
+
 def get_settings() -> Settings:
-    return Settings()
+    """Obtiene la configuración (singleton)"""
+    global _settings
+    
+    if _settings is None:
+        _settings = Settings()
+    
+    return _settings
+
+
+def configure_logging(debug: bool = False) -> None:
+    """
+    Configura el logging de la app. Los logs pasan por una cola y un hilo
+    (QueueListener) escribe en stdout, así logger.info() no bloquea el event loop.
+    INFO para los módulos de la app (DEBUG si debug); WARNING para librerías.
+    """
+    global _log_listener
+    
+    if _log_listener is None:
+        log_queue = queue.SimpleQueue()
+        
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        
+        _log_listener = QueueListener(log_queue, handler)
+        _log_listener.start()
+        atexit.register(_log_listener.stop)
+        
+        logging.getLogger().addHandler(QueueHandler(log_queue))
+    
+    logging.getLogger("app").setLevel(logging.DEBUG if debug else logging.INFO)
@@ -3,60 +3,89 @@ Video to Audio API
 Microservicio para extraer audio de videos de YouTube/Vimeo
 """
 import asyncio
-import time
+import logging
 from contextlib import asynccontextmanager
 from pathlib import Path
 
+import anyio
 from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from starlette.status import HTTP_504_GATEWAY_TIMEOUT
+from fastapi.responses import ORJSONResponse
 
-from .config import get_settings
+from .config import configure_logging, get_settings
 from .routes import router
-from .services import video
+from .services import storage, video, workers
 
 
+logger = logging.getLogger(__name__)
+
 TEMP_DIR = Path("/tmp/video-to-audio")
 
+# Rutas de upload excluidas del timeout global (/api/upload, /download, /extract, /streaming)
+EXCLUDED_PREFIXES = ("/api/upload",)
+
+# Timeout para las demás rutas: 10 minutos
+TIMEOUT_LIMIT = 600
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle de la aplicación"""
     # Startup
     TEMP_DIR.mkdir(parents=True, exist_ok=True)
-    settings = get_settings()
+    settings = app.state.settings
+    workers.start_job_workers()
     
-    print("=" * 60)
-    print("🚀 Video to Audio API")
-    print(f"📦 Version: 1.0.0")
-    print(f"🗄️  Supabase: {'✅ Configurado' if settings.supabase_url else '❌ No configurado'}")
-    print(f"⏱️  Max duración: {settings.max_duration_minutes} min")
-    print(f"💾 Max tamaño archivo: {settings.max_file_size_mb} MB")
-    print("=" * 60)
+    if settings.debug:
+        logger.info(
+            "\n".join([
+                "=" * 60,
+                "🚀 Video to Audio API",
+                "📦 Version: 1.0.0",
+                f"🗄️  Supabase: {'✅ Configurado' if settings.supabase_url else '❌ No configurado'}",
+                f"⏱️  Max duración: {settings.max_duration_minutes} min",
+                f"💾 Max tamaño archivo: {settings.max_file_size_mb} MB",
+                "=" * 60,
+            ])
+        )
     
     yield
     
     # Shutdown
+    await workers.stop_job_workers()
+    workers.shutdown_process_pool()
+    workers.shutdown_thread_pools()
+    await storage.close_async_supabase_client()
+    storage.close_http_session()
     cleaned = video.cleanup_old_files(max_age_hours=0)
-    print("=" * 60)
-    print(f"👋 Video to Audio API detenida")
-    print(f"🧹 Archivos temporales limpiados: {cleaned}")
-    print("=" * 60)
+    logger.info(
+        "\n".join([
+            "=" * 60,
+            "👋 Video to Audio API detenida",
+            f"🧹 Archivos temporales limpiados: {cleaned}",
+            "=" * 60,
+        ])
+    )
 
 
 def create_app() -> FastAPI:
     """Factory de la aplicación"""
+    from fastapi.middleware.cors import CORSMiddleware
+    
     settings = get_settings()
     
+    # Logging: INFO en producción, DEBUG para los módulos de la app si settings.debug
+    configure_logging(settings.debug)
+    
     app = FastAPI(
         title="Video to Audio API",
         description="Extrae audio de videos de YouTube/Vimeo y los sube a Supabase",
         version="1.0.0",
         lifespan=lifespan,
+        default_response_class=ORJSONResponse,
         docs_url="/docs",
         redoc_url="/redoc",
     )
+    app.state.settings = settings
     
     # CORS
     app.add_middleware(
@@ -70,40 +99,31 @@ def create_app() -> FastAPI:
     # Middleware de timeout para peticiones largas (EXCEPTO uploads)
     @app.middleware("http")
     async def timeout_middleware(request: Request, call_next):
-        start_time = time.time()
-        
-        # Excluir rutas de upload del timeout global
-        EXCLUDED_PATHS = [
-            "/api/upload",
-            "/api/upload/download", 
-            "/api/upload/extract",
-            "/api/upload/streaming",  # Nueva ruta sin timeout
-        ]
-        
-        # Log de request entrante (solo para endpoints importantes)
-        if request.url.path.startswith("/api/") and not request.url.path == "/api/health":
-            print(f"📥 {request.method} {request.url.path}")
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        path = request.url.path
+        method = request.method
         
         # Si la ruta está excluida, no aplicar timeout
-        if any(request.url.path.startswith(path) for path in EXCLUDED_PATHS):
+        if path.startswith(EXCLUDED_PREFIXES):
             return await call_next(request)
         
-        # Para otras rutas, aplicar timeout de 10 minutos
-        TIMEOUT_LIMIT = 600  # 10 minutos
-        
         try:
-            response = await asyncio.wait_for(call_next(request), timeout=TIMEOUT_LIMIT)
+            with anyio.fail_after(TIMEOUT_LIMIT):
+                response = await call_next(request)
             
             # Log de respuesta exitosa (solo requests lentos)
-            process_time = time.time() - start_time
+            process_time = loop.time() - start_time
             if process_time > 5:  # Solo loguear requests lentos
-                print(f"⏱️  {request.method} {request.url.path} - {process_time:.2f}s")
+                logger.info("⏱️  %s %s - %.2fs", method, path, process_time)
             
             return response
-        except asyncio.TimeoutError:
-            process_time = time.time() - start_time
-            print(f"❌ TIMEOUT: {request.method} {request.url.path} - {process_time:.2f}s")
-            return JSONResponse(
+        except TimeoutError:
+            from starlette.status import HTTP_504_GATEWAY_TIMEOUT
+            
+            process_time = loop.time() - start_time
+            logger.warning("❌ TIMEOUT: %s %s - %.2fs", method, path, process_time)
+            return ORJSONResponse(
                 {
                     'detail': f'La petición excedió el límite de {TIMEOUT_LIMIT} segundos.',
                     'processing_time': process_time
@@ -130,4 +150,4 @@ app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools", reload=True)
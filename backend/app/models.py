@@ -1,10 +1,11 @@
 """
 Modelos de datos
 """
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum
-from typing import Optional
-from pydantic import BaseModel, field_validator
+from typing import Annotated, Literal, Optional
+from urllib.parse import urlsplit
+from pydantic import BaseModel, ConfigDict, Field, NonNegativeInt, computed_field, field_validator
 
 
 class AudioFormat(str, Enum):
@@ -21,6 +22,11 @@ class AudioQuality(str, Enum):
     BEST = "320"
 
 
+# Valores aceptados en los requests (validación por literal, sin coerción a Enum)
+AudioFormatLiteral = Literal["mp3", "m4a", "wav", "opus"]
+AudioQualityLiteral = Literal["128", "192", "256", "320"]
+
+
 class JobStatus(str, Enum):
     PENDING = "pending"
     PROCESSING = "processing"
@@ -33,85 +39,81 @@ class JobStatus(str, Enum):
 
 # ============== Requests ==============
 
+# Plataformas de video soportadas (sufijo del host)
+_VIDEO_HOST_SUFFIXES = ("youtube.com", "youtu.be", "vimeo.com")
+
+# Supabase Storage (las URLs pueden no tener extensión visible)
+_SUPABASE_HOST_SUFFIX = "supabase.co"
+
+# Extensiones de archivos de video directos
+_VIDEO_EXTENSIONS = (".mp4", ".mkv", ".webm", ".avi", ".mov", ".flv", ".wmv", ".m4v", ".mpeg", ".mpg", ".3gp")
+
+
+def _validate_video_url(v: str) -> str:
+    """Valida que la URL sea de una plataforma o archivo de video soportado"""
+    v = v.strip()
+    
+    parts = urlsplit(v)
+    if not parts.netloc:
+        # URL sin esquema (ej. "youtube.com/watch?v=...")
+        parts = urlsplit(f"//{v}")
+    host = parts.hostname or ""
+    
+    if (
+        host.endswith(_VIDEO_HOST_SUFFIXES)
+        or (host.endswith(_SUPABASE_HOST_SUFFIX) and "/storage" in parts.path)
+        or parts.path.lower().endswith(_VIDEO_EXTENSIONS)
+    ):
+        return v
+    
+    raise ValueError("Solo se soportan URLs de YouTube, Vimeo o archivos de video directos (.mp4, .mkv, .webm, etc.)")
+
+
 class ExtractRequest(BaseModel):
     url: str
-    format: AudioFormat = AudioFormat.MP3
-    quality: AudioQuality = AudioQuality.MEDIUM
+    format: AudioFormatLiteral = "mp3"
+    quality: AudioQualityLiteral = "192"
     
     @field_validator("url")
     @classmethod
     def validate_url(cls, v: str) -> str:
-        v = v.strip()
-        
-        # Soportar YouTube/Vimeo
-        video_platforms = ["youtube.com", "youtu.be", "vimeo.com"]
-        if any(domain in v.lower() for domain in video_platforms):
-            return v
-        
-        # Soportar URLs directas de archivos de video
-        video_extensions = [".mp4", ".mkv", ".webm", ".avi", ".mov", ".flv", ".wmv", ".m4v", ".mpeg", ".mpg", ".3gp"]
-        if any(v.lower().endswith(ext) for ext in video_extensions):
-            return v
-        
-        # Soportar URLs de Supabase Storage (pueden no tener extensión visible)
-        if "supabase.co/storage" in v.lower():
-            return v
-        
-        raise ValueError("Solo se soportan URLs de YouTube, Vimeo o archivos de video directos (.mp4, .mkv, .webm, etc.)")
-
+        return _validate_video_url(v)
 
 
 class ProcessRequest(BaseModel):
     """Request para el endpoint síncrono /process"""
     video_url: str
-    format: AudioFormat = AudioFormat.MP3
-    quality: AudioQuality = AudioQuality.MEDIUM
+    format: AudioFormatLiteral = "mp3"
+    quality: AudioQualityLiteral = "192"
     
     @field_validator("video_url")
     @classmethod
     def validate_url(cls, v: str) -> str:
-        v = v.strip()
-        
-        # Soportar YouTube/Vimeo
-        video_platforms = ["youtube.com", "youtu.be", "vimeo.com"]
-        if any(domain in v.lower() for domain in video_platforms):
-            return v
-        
-        # Soportar URLs directas de archivos de video
-        video_extensions = [".mp4", ".mkv", ".webm", ".avi", ".mov", ".flv", ".wmv", ".m4v", ".mpeg", ".mpg", ".3gp"]
-        if any(v.lower().endswith(ext) for ext in video_extensions):
-            return v
-        
-        # Soportar URLs de Supabase Storage
-        if "supabase.co/storage" in v.lower():
-            return v
-        
-        raise ValueError("Solo se soportan URLs de YouTube, Vimeo o archivos de video directos (.mp4, .mkv, .webm, etc.)")
+        return _validate_video_url(v)
 
 
 # ============== Responses ==============
 
+def _ms_to_iso(ms: int) -> str:
+    """Convierte epoch-ms a ISO 8601 (UTC)"""
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
 class VideoInfo(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     id: Optional[str] = None  # ✅ CAMBIO: Ahora es opcional
     title: Optional[str] = None  # Ya era opcional
-    duration_seconds: Optional[int] = None  # Ya era opcional
+    duration_seconds: Optional[NonNegativeInt] = None  # Ya era opcional
     duration_formatted:  Optional[str] = None  # Ya era opcional
     thumbnail: Optional[str] = None
     source: Optional[str] = None  # ✅ CAMBIO:  Ahora es opcional
     channel:  Optional[str] = None
 
 
-class JobResponse(BaseModel):
-    job_id: str
-    status: JobStatus
-    progress:  int = 0  # 0-100
-    message: str = ""
-    created_at:  datetime
-    video_info: Optional[VideoInfo] = None
-    result:  Optional["ExtractResult"] = None
-
-
 class ExtractResult(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     success: bool
     audio_url: Optional[str] = None
     filename: Optional[str] = None
@@ -121,6 +123,23 @@ class ExtractResult(BaseModel):
     error: Optional[str] = None
 
 
+class JobResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    job_id: str
+    status: JobStatus
+    progress: Annotated[int, Field(ge=0, le=100)] = 0
+    message: str = ""
+    created_at_ms: int = Field(exclude=True)  # epoch-ms
+    video_info: Optional[VideoInfo] = None
+    result:  Optional[ExtractResult] = None
+    
+    @computed_field
+    @property
+    def created_at(self) -> str:
+        return _ms_to_iso(self.created_at_ms)
+
+
 class HealthResponse(BaseModel):
     status: str
     version: str
@@ -137,10 +156,12 @@ class StatsResponse(BaseModel):
 
 class ProcessResponse(BaseModel):
     """Respuesta del endpoint síncrono /process"""
+    model_config = ConfigDict(frozen=True)
+    
     status:  str  # "success" o "error"
     audio_url: Optional[str] = None
     video_info: Optional[VideoInfo] = None
-    file_size: Optional[int] = None
+    file_size: Optional[NonNegativeInt] = None
     file_size_formatted: Optional[str] = None
     duration: Optional[int] = None
     duration_formatted: Optional[str] = None
@@ -153,10 +174,12 @@ class ProcessResponse(BaseModel):
 
 class UploadResponse(BaseModel):
     """Respuesta del endpoint /upload"""
+    model_config = ConfigDict(frozen=True)
+    
     status: str  # "success" o "error"
     audio_url: Optional[str] = None
     filename: Optional[str] = None
-    file_size: Optional[int] = None
+    file_size: Optional[NonNegativeInt] = None
     file_size_formatted: Optional[str] = None
     original_size: Optional[int] = None
     original_size_formatted: Optional[str] = None
@@ -179,9 +202,11 @@ class ExecutionSource(str, Enum):
 
 class ExecutionLog(BaseModel):
     """Log de una ejecución"""
+    model_config = ConfigDict(frozen=True)
+    
     id:  str
     source: ExecutionSource
-    timestamp: datetime
+    timestamp_ms: int = Field(exclude=True)  # epoch-ms
     video_url: str
     video_title: Optional[str] = None
     status:  str  # "success" o "error"
@@ -193,13 +218,17 @@ class ExecutionLog(BaseModel):
     processing_time: Optional[float] = None
     error_code: Optional[str] = None
     error_message: Optional[str] = None
+    
+    @computed_field
+    @property
+    def timestamp(self) -> str:
+        return _ms_to_iso(self.timestamp_ms)
 
 
 class LogsResponse(BaseModel):
     """Respuesta de logs"""
+    model_config = ConfigDict(frozen=True)
+    
     total: int
     logs: list[ExecutionLog]
 
-
-# Para referencias circulares
-JobResponse.model_rebuild()
@@ -1,13 +1,18 @@
 """
 Rutas de la API
 """
-import os
 import time
 import asyncio
-import tempfile
+import hashlib
+import io
+import logging
+import os
+from functools import partial
 from pathlib import Path
-from fastapi import APIRouter, BackgroundTasks, HTTPException, UploadFile, File, Form
-from fastapi.responses import StreamingResponse
+import aiofiles
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 
 from .config import get_settings
 from .models import (
@@ -22,10 +27,12 @@ from .models import (
     AudioQuality,
     UploadResponse,
 )
-from .services import jobs, storage, video, db, upload
+from .services import jobs, storage, video, db, upload, workers
 from . import __version__
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
@@ -57,7 +64,7 @@ async def get_video_info(url: str):
     - Supabase Storage: https://[project].supabase.co/storage/v1/object/public/...
     """
     try:
-        info = video.get_video_info(url)
+        info = await workers.run_in_io_thread(video.get_video_info, url)
         return info
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -65,8 +72,95 @@ async def get_video_info(url: str):
 
 # ============== API Mode - Synchronous Processing ==============
 
+class _SharedExtraction:
+    """Procesamiento compartido en curso: la tarea que lo ejecuta y los jobs que esperan su resultado"""
+    
+    def __init__(self, job_id: str):
+        self.job_ids = [job_id]
+        self.uploading = False
+        self.task: asyncio.Task | None = None
+
+
+# Procesamientos en curso: peticiones idénticas simultáneas comparten una sola descarga + ffmpeg
+_in_flight: dict[str, _SharedExtraction] = {}
+
+
+async def _mark_uploading(job_ids: list[str]) -> None:
+    """Pasa a "uploading" los jobs que esperan un procesamiento compartido"""
+    await asyncio.gather(
+        *(jobs.update_job(job_id, status="uploading", progress=80, stage="Subiendo...") for job_id in job_ids)
+    )
+
+
+async def _run_shared_extraction(
+    shared: _SharedExtraction,
+    video_url: str,
+    audio_format: str,
+    audio_quality: str,
+) -> tuple[str, VideoInfo, int, Path]:
+    """Cuerpo de la tarea compartida: descarga, extrae y sube el audio"""
+    audio_file, video_info = await workers.run_in_process(
+        video.download_and_extract,
+        video_url,
+        AudioFormat(audio_format),
+        AudioQuality(audio_quality),
+        None,
+    )
+    
+    # Sin await entre el flag y la copia: quien se sume después actualiza su propio job
+    shared.uploading = True
+    await _mark_uploading(list(shared.job_ids))
+    
+    audio_url = await workers.run_in_io_thread(storage.upload_file, audio_file)
+    return audio_url, video_info, audio_file.stat().st_size, audio_file
+
+
+async def _extract_and_upload_shared(
+    video_url: str,
+    audio_format: str,
+    audio_quality: str,
+    job_id: str,
+) -> tuple[str, VideoInfo, int, Path]:
+    """
+    Descarga, extrae y sube el audio. Si ya hay un procesamiento idéntico
+    (url + formato + calidad) en curso, espera su resultado en lugar de repetirlo.
+    Cada petición conserva su propio job para auditoría.
+    
+    El trabajo corre en una tarea propia: que una petición se cancele (desconexión,
+    timeout) no cancela el procesamiento para las demás.
+    
+    Returns:
+        (audio_url, video_info, tamaño en bytes, archivo de audio local para limpiar)
+    """
+    key = hashlib.sha1(f"{video_url}|{audio_format}|{audio_quality}".encode()).hexdigest()
+    
+    shared = _in_flight.get(key)
+    if shared is not None:
+        logger.info("🔁 Reutilizando procesamiento en curso para: %s", video_url)
+        shared.job_ids.append(job_id)
+        if shared.uploading:
+            await _mark_uploading([job_id])
+    else:
+        shared = _SharedExtraction(job_id)
+        shared.task = asyncio.create_task(
+            _run_shared_extraction(shared, video_url, audio_format, audio_quality)
+        )
+        _in_flight[key] = shared
+        
+        def _on_done(task: asyncio.Task) -> None:
+            _in_flight.pop(key, None)
+            # Evita el aviso "exception was never retrieved" si todas las peticiones se cancelaron
+            if not task.cancelled():
+                task.exception()
+        
+        shared.task.add_done_callback(_on_done)
+    
+    # shield: cancelar esta petición no cancela la tarea compartida
+    return await asyncio.shield(shared.task)
+
+
 @router.post("/process", response_model=ProcessResponse)
-async def process_video(request: ProcessRequest):
+async def process_video(request: ProcessRequest, background_tasks: BackgroundTasks):
     """
     **Modo API** - Procesa un video de forma síncrona.
     Guarda el job en Supabase para auditoría.
@@ -79,7 +173,7 @@ async def process_video(request: ProcessRequest):
     start_time = time.time()
     settings = get_settings()
     
-    print(f"🎬 Procesando video: {request.video_url}")
+    logger.info("🎬 Procesando video: %s", request.video_url)
     
     if not storage.is_configured():
         return ProcessResponse(
@@ -89,22 +183,22 @@ async def process_video(request: ProcessRequest):
         )
     
     # Crear job en Supabase
-    job_data = db.create_job(
+    job_data = await db.create_job(
         video_url=request.video_url,
-        format=request.format.value,
-        quality=request.quality.value,
+        format=request.format,
+        quality=request.quality,
         source="api"
     )
     job_id = job_data["id"]
     
     try:
         # 1. Obtener info del video
-        db.update_job(job_id, status="processing", progress=10, stage="Obteniendo información...")
+        await jobs.update_job(job_id, status="processing", progress=10, stage="Obteniendo información...")
         
-        video_info = await asyncio.to_thread(video.get_video_info, request.video_url)
+        video_info = await workers.run_in_io_thread(video.get_video_info, request.video_url)
         
         # Guardar info del video
-        db.update_job(
+        await jobs.update_job(
             job_id,
             video_title=video_info.title,
             video_id=video_info.id,
@@ -116,7 +210,7 @@ async def process_video(request: ProcessRequest):
         
         # 2. Verificar duración
         if video_info.duration_seconds > settings.max_duration_minutes * 60:
-            db.update_job(
+            await jobs.update_job(
                 job_id,
                 status="failed",
                 error_code="VIDEO_TOO_LONG",
@@ -129,34 +223,27 @@ async def process_video(request: ProcessRequest):
                 video_info=video_info,
             )
         
-        # 3. Descargar y extraer
-        db.update_job(job_id, status="downloading", progress=30, stage="Descargando...")
+        # 3-4. Descargar, extraer y subir a Supabase (compartido con peticiones idénticas en curso)
+        await jobs.update_job(job_id, status="downloading", progress=30, stage="Descargando...")
         
-        audio_file, video_info = await asyncio.to_thread(
-            video.download_and_extract,
+        audio_url, video_info, file_size, audio_file = await _extract_and_upload_shared(
             request.video_url,
             request.format,
             request.quality,
-            None,
+            job_id,
         )
         
-        # 4. Subir a Supabase
-        db.update_job(job_id, status="uploading", progress=80, stage="Subiendo...")
-        
-        audio_url = await asyncio.to_thread(storage.upload_file, audio_file)
+        # El audio local ya está en Supabase: se elimina después de enviar la respuesta
+        background_tasks.add_task(video.cleanup_file, audio_file)
         
-        # 5. Obtener tamaño
-        file_size = audio_file.stat().st_size
+        # 5. Formatear tamaño
         file_size_formatted = video.format_file_size(file_size)
         
-        # 6. Limpiar archivo temporal
-        video.cleanup_file(audio_file)
-        
-        # 7. Calcular tiempo
+        # 6. Calcular tiempo
         processing_time = round(time.time() - start_time, 2)
         
-        # 8. Actualizar job como completado
-        db.update_job(
+        # 7. Actualizar job como completado
+        await jobs.update_job(
             job_id,
             status="completed",
             progress=100,
@@ -166,7 +253,7 @@ async def process_video(request: ProcessRequest):
             processing_time=processing_time,
         )
         
-        print(f"✅ Video procesado en {processing_time}s")
+        logger.info("✅ Video procesado en %ss", processing_time)
         return ProcessResponse(
             status="success",
             audio_url=audio_url,
@@ -175,17 +262,17 @@ async def process_video(request: ProcessRequest):
             file_size_formatted=file_size_formatted,
             duration=video_info.duration_seconds,
             duration_formatted=video_info.duration_formatted,
-            format=request.format.value,
-            quality=request.quality.value,
+            format=request.format,
+            quality=request.quality,
             processing_time=processing_time,
             message="Audio extraído exitosamente",
         )
         
     except Exception as e:
         processing_time = round(time.time() - start_time, 2)
-        print(f"❌ Error procesando: {str(e)}")
+        logger.error("❌ Error procesando: %s", e)
         
-        db.update_job(
+        await jobs.update_job(
             job_id,
             status="failed",
             error_code="INTERNAL_ERROR",
@@ -203,11 +290,60 @@ async def process_video(request: ProcessRequest):
 
 # ============== API Mode - Download Direct ==============
 
+async def _finish_backup_upload(
+    upload_task: asyncio.Task | None,
+    audio_file: Path,
+    job_id: str | None = None,
+    start_time: float | None = None,
+    **job_fields,
+) -> None:
+    """
+    Se ejecuta después de enviar el audio al cliente: espera el backup en Supabase
+    (upload_task es None si el backup está desactivado), actualiza el job (si hay)
+    y elimina el audio temporal.
+    """
+    try:
+        audio_url = await upload_task if upload_task else None
+        if job_id:
+            await jobs.update_job(
+                job_id,
+                status="completed",
+                progress=100,
+                stage="Completado",
+                audio_url=audio_url,
+                processing_time=round(time.time() - start_time, 2),
+                **job_fields,
+            )
+    except Exception as e:
+        logger.error("❌ Error subiendo backup: %s", e)
+        if job_id:
+            await jobs.update_job(
+                job_id,
+                status="failed",
+                error_code="BACKUP_UPLOAD_FAILED",
+                error_message=str(e),
+                processing_time=round(time.time() - start_time, 2),
+            )
+    finally:
+        video.cleanup_file(audio_file)
+
+
+def _start_backup_upload(audio_file: Path) -> tuple[str, asyncio.Task]:
+    """Lanza la subida a Supabase en segundo plano. La URL pública se conoce de antemano"""
+    storage_path = storage.build_storage_path(audio_file)
+    upload_task = asyncio.create_task(
+        workers.run_in_io_thread(partial(storage.upload_file, audio_file, storage_path=storage_path))
+    )
+    return storage.get_public_url(storage_path), upload_task
+
+
 @router.post("/process/download")
-async def process_and_download(request: ProcessRequest):
+async def process_and_download(request: ProcessRequest, backup: bool = True):
     """
     **Modo API** - Procesa y devuelve el archivo de audio directamente.
     Ideal para n8n cuando necesitas el binario del audio.
+    
+    - **backup**: Si es false no se sube copia a Supabase (el job se registra igual)
     """
     start_time = time.time()
     settings = get_settings()
@@ -216,22 +352,22 @@ async def process_and_download(request: ProcessRequest):
         raise HTTPException(status_code=503, detail="Supabase no configurado")
     
     # Crear job en Supabase
-    job_data = db.create_job(
+    job_data = await db.create_job(
         video_url=request.video_url,
-        format=request.format.value,
-        quality=request.quality.value,
+        format=request.format,
+        quality=request.quality,
         source="api"
     )
     job_id = job_data["id"]
     
     try:
         # 1. Obtener info del video
-        db.update_job(job_id, status="processing", progress=10, stage="Obteniendo información...")
+        await jobs.update_job(job_id, status="processing", progress=10, stage="Obteniendo información...")
         
-        video_info = await asyncio.to_thread(video.get_video_info, request.video_url)
+        video_info = await workers.run_in_io_thread(video.get_video_info, request.video_url)
         
         # Guardar info del video
-        db.update_job(
+        await jobs.update_job(
             job_id,
             video_title=video_info.title,
             video_id=video_info.id,
@@ -243,7 +379,7 @@ async def process_and_download(request: ProcessRequest):
         
         # 2. Verificar duración
         if video_info.duration_seconds > settings.max_duration_minutes * 60:
-            db.update_job(
+            await jobs.update_job(
                 job_id,
                 status="failed",
                 error_code="VIDEO_TOO_LONG",
@@ -255,69 +391,58 @@ async def process_and_download(request: ProcessRequest):
             )
         
         # 3. Descargar y extraer
-        db.update_job(job_id, status="downloading", progress=30, stage="Descargando...")
+        await jobs.update_job(job_id, status="downloading", progress=30, stage="Descargando...")
         
-        audio_file, video_info = await asyncio.to_thread(
+        audio_file, video_info = await workers.run_in_process(
             video.download_and_extract,
             request.video_url,
-            request.format,
-            request.quality,
+            AudioFormat(request.format),
+            AudioQuality(request.quality),
             None,
         )
         
-        # 4. Leer el archivo en memoria
-        db.update_job(job_id, status="uploading", progress=70, stage="Preparando...")
-        
-        with open(audio_file, "rb") as f:
-            audio_data = f.read()
+        # 4. Obtener info del archivo
+        await jobs.update_job(job_id, status="uploading", progress=70, stage="Preparando...")
         
-        file_size = len(audio_data)
+        file_size = audio_file.stat().st_size
         file_size_formatted = video.format_file_size(file_size)
-        filename = os.path.basename(str(audio_file))
+        filename = audio_file.name
         
-        # 5. Subir a Supabase (backup)
-        db.update_job(job_id, progress=85, stage="Subiendo backup...")
-        audio_url = await asyncio.to_thread(storage.upload_file, audio_file)
-        
-        # 6. Limpiar archivo temporal
-        video.cleanup_file(audio_file)
+        # 5. Subir a Supabase (backup) en paralelo con el envío al cliente
+        audio_url, upload_task = _start_backup_upload(audio_file) if backup else (None, None)
+        if backup:
+            await jobs.update_job(job_id, progress=85, stage="Subiendo backup...")
         
-        # 7. Calcular tiempo
+        # 6. Calcular tiempo
         processing_time = round(time.time() - start_time, 2)
         
-        # 8. Actualizar job como completado
-        db.update_job(
-            job_id,
-            status="completed",
-            progress=100,
-            stage="Completado",
-            audio_url=audio_url,
-            file_size=file_size_formatted,
-            processing_time=processing_time,
-        )
+        # 7. Determinar content type
+        content_type = storage.get_content_type(request.format)
         
-        # 9. Determinar content type
-        content_types = {
-            "mp3": "audio/mpeg",
-            "m4a": "audio/mp4",
-            "wav": "audio/wav",
-            "opus": "audio/opus"
+        headers = {
+            "X-Job-ID": job_id,
+            "X-Video-Title": video_info.title[:100] if video_info.title else "",
+            "X-Processing-Time": str(processing_time),
+            "X-File-Size": file_size_formatted,
         }
-        content_type = content_types.get(request.format.value, "audio/mpeg")
+        if audio_url:
+            headers["X-Audio-URL"] = audio_url
         
-        # 10. Devolver archivo directamente
-        return StreamingResponse(
-            iter([audio_data]),
+        # 8. Devolver archivo directamente. Al terminar el envío se espera el backup,
+        #    se marca el job como completado y se elimina el audio temporal
+        return FileResponse(
+            audio_file,
             media_type=content_type,
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Content-Length": str(file_size),
-                "X-Audio-URL": audio_url,
-                "X-Job-ID": job_id,
-                "X-Video-Title": video_info.title[:100] if video_info.title else "",
-                "X-Processing-Time": str(processing_time),
-                "X-File-Size": file_size_formatted,
-            }
+            filename=filename,
+            background=BackgroundTask(
+                _finish_backup_upload,
+                upload_task,
+                audio_file,
+                job_id,
+                start_time,
+                file_size=file_size_formatted,
+            ),
+            headers=headers,
         )
         
     except HTTPException:
@@ -325,7 +450,7 @@ async def process_and_download(request: ProcessRequest):
     except Exception as e:
         processing_time = round(time.time() - start_time, 2)
         
-        db.update_job(
+        await jobs.update_job(
             job_id,
             status="failed",
             error_code="INTERNAL_ERROR",
@@ -338,12 +463,183 @@ async def process_and_download(request: ProcessRequest):
 
 # ============== File Upload ==============
 
-@router.post("/upload", response_model=UploadResponse)
-async def upload_video_file(
-    file: UploadFile = File(...),
-    format: str = Form("mp3"),
-    quality: str = Form("192"),
-):
+async def _iter_upload(file: UploadFile, chunk_size: int = 4 * 1024 * 1024):
+    """Lee el archivo subido en chunks (4MB por defecto) para no cargarlo entero en memoria"""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+_RECEIVE_PROGRESS_STEP = 50 * 1024 * 1024  # Progreso cada 50MB recibidos
+
+
+async def _report_receive_progress(job_id: str, total_written: int, max_progress: int) -> None:
+    """Progreso de la recepción del archivo (de 5% a max_progress)"""
+    progress = min(5 + ((total_written * (max_progress - 5)) >> 30), max_progress)
+    await jobs.update_job(
+        job_id,
+        progress=progress,
+        stage=f"Recibiendo archivo... ({upload.format_megabytes(total_written)})",
+    )
+
+
+async def _receive_upload_to_file(
+    file: UploadFile,
+    file_path: Path,
+    job_id: str,
+    max_progress: int,
+) -> int:
+    """
+    Copia el archivo subido a file_path reportando el progreso del job cada 50MB
+    (de 5% a max_progress). Si el upload está en disco (SpooledTemporaryFile) se copia
+    con sendfile dentro del kernel; si no, con los buffers del pool.
+    
+    Returns:
+        Bytes escritos
+    """
+    try:
+        # fileno() pasa a disco la parte que el SpooledTemporaryFile tenga en memoria
+        src_fd = file.file.fileno()
+    except (AttributeError, OSError, ValueError):
+        src_fd = None
+    
+    if src_fd is not None:
+        try:
+            return await _sendfile_upload(src_fd, file.file.tell(), file_path, job_id, max_progress)
+        except OSError as e:
+            # sendfile no soportado entre estos archivos: copiar con buffers
+            logger.debug("sendfile no disponible (%s), copiando con buffers", e)
+    
+    return await _copy_upload_buffered(file, file_path, job_id, max_progress)
+
+
+async def _sendfile_upload(
+    src_fd: int,
+    offset: int,
+    file_path: Path,
+    job_id: str,
+    max_progress: int,
+) -> int:
+    """Copia src_fd (desde offset) a file_path con os.sendfile, de a 50MB por llamada"""
+    total_written = 0
+    
+    with open(file_path, "wb") as dst:
+        while True:
+            sent = await asyncio.to_thread(os.sendfile, dst.fileno(), src_fd, offset, _RECEIVE_PROGRESS_STEP)
+            if not sent:
+                break
+            offset += sent
+            total_written += sent
+            await _report_receive_progress(job_id, total_written, max_progress)
+    
+    return total_written
+
+
+async def _copy_upload_buffered(
+    file: UploadFile,
+    file_path: Path,
+    job_id: str,
+    max_progress: int,
+) -> int:
+    """Copia el upload con dos buffers del pool (se lee en uno mientras se escribe el otro)"""
+    next_progress_at = _RECEIVE_PROGRESS_STEP
+    total_written = 0
+    
+    buffers = [upload.receive_buffer_pool.acquire(), upload.receive_buffer_pool.acquire()]
+    current = 0
+    next_read = asyncio.create_task(asyncio.to_thread(file.file.readinto, buffers[current]))
+    try:
+        async with aiofiles.open(file_path, "wb") as temp_file:
+            while True:
+                read_size = await next_read
+                if not read_size:
+                    break
+                chunk = memoryview(buffers[current])[:read_size]
+                current ^= 1
+                next_read = asyncio.create_task(asyncio.to_thread(file.file.readinto, buffers[current]))
+                await temp_file.write(chunk)
+                total_written += read_size
+                
+                if total_written >= next_progress_at:
+                    next_progress_at += _RECEIVE_PROGRESS_STEP
+                    await _report_receive_progress(job_id, total_written, max_progress)
+    finally:
+        # El hilo de la lectura pendiente sigue usando su buffer: esperar antes de devolverlos
+        await asyncio.wait({next_read})
+        for buffer in buffers:
+            upload.receive_buffer_pool.release(buffer)
+    
+    return total_written
+
+
+# /upload y /upload/download leen el body con request.stream(); se documenta el form a mano
+_UPLOAD_FORM_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "format": {"type": "string", "default": "mp3"},
+                        "quality": {"type": "string", "default": "192"},
+                        "backup": {
+                            "type": "boolean",
+                            "default": True,
+                            "description": "Solo /upload/download: false para no subir copia a Supabase",
+                        },
+                        "file": {"type": "string", "format": "binary"},
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+def _content_length(request: Request) -> int:
+    """Content-Length del request (0 si no viene o no es válido)"""
+    try:
+        return int(request.headers.get("content-length", 0))
+    except ValueError:
+        return 0
+
+
+def _parse_bool(value: str | None, default: bool) -> bool:
+    """Booleano de un campo de form ("true"/"false", "1"/"0", "yes"/"no")"""
+    if value is None:
+        return default
+    return value.strip().lower() not in ("false", "0", "no", "off", "")
+
+
+def _has_audio_options(fields: dict[str, str]) -> bool:
+    """True si format y quality ya se recibieron"""
+    return "format" in fields and "quality" in fields
+
+
+# Valores del form → enum (formato/calidad no válidos usan el valor por defecto)
+_FORMAT_MAP = {f.value: f for f in AudioFormat}
+_QUALITY_MAP = {q.value: q for q in AudioQuality}
+
+
+def _audio_options(format: str, quality: str) -> tuple[AudioFormat, AudioQuality]:
+    """Formato y calidad pedidos (MP3 / 192 kbps si no son válidos)"""
+    return (
+        _FORMAT_MAP.get(format.lower(), AudioFormat.MP3),
+        _QUALITY_MAP.get(quality, AudioQuality.MEDIUM),
+    )
+
+
+def _parse_audio_options(fields: dict[str, str]) -> tuple[AudioFormat, AudioQuality]:
+    """Formato y calidad del form (valores por defecto si faltan o no son válidos)"""
+    return _audio_options(fields.get("format", "mp3"), fields.get("quality", "192"))
+
+
+@router.post("/upload", response_model=UploadResponse, openapi_extra=_UPLOAD_FORM_OPENAPI)
+async def upload_video_file(request: Request, background_tasks: BackgroundTasks):
     """
     **Upload de archivo** - Sube un archivo de video y extrae el audio.
     
@@ -356,8 +652,6 @@ async def upload_video_file(
     """
     start_time = time.time()
     
-    print(f"📤 Upload iniciado: {file.filename} ({file.size / 1024 / 1024:.1f}MB)" if file.size else f"📤 Upload iniciado: {file.filename}")
-    
     if not storage.is_configured():
         return UploadResponse(
             status="error",
@@ -365,28 +659,45 @@ async def upload_video_file(
             message="Supabase no está configurado"
         )
     
-    # Validar formato de archivo
-    if not file.filename or not upload.is_valid_video_file(file.filename):
+    max_size_bytes = upload.MAX_UPLOAD_BYTES
+    
+    # Rechazar antes de leer el body si Content-Length ya supera el máximo
+    content_length = _content_length(request)
+    if content_length > max_size_bytes:
         return UploadResponse(
             status="error",
-            error_code="INVALID_FILE_FORMAT",
-            message="Formato de archivo no soportado. Usa: mp4, mkv, webm, avi, mov, flv, wmv"
+            error_code="FILE_TOO_LARGE",
+            message=str(upload.FileTooLargeError(content_length)),
         )
     
-    # Validar parámetros
+    # Leer el multipart en streaming hasta el inicio del archivo
     try:
-        audio_format = AudioFormat(format.lower())
-    except ValueError:
-        audio_format = AudioFormat.MP3
+        form = upload.MultipartUploadStream(request.headers.get("content-type", ""), request.stream())
+        await form.start()
+    except ValueError as e:
+        return UploadResponse(
+            status="error",
+            error_code="INVALID_REQUEST",
+            message=str(e)
+        )
+    filename = form.filename
     
-    try:
-        audio_quality = AudioQuality(quality)
-    except ValueError:
-        audio_quality = AudioQuality.MEDIUM
+    logger.info("📤 Upload iniciado: %s", filename)
+    
+    # Validar formato (extensión + Content-Type) antes de leer el contenido
+    if not upload.is_valid_video_upload(filename, form.content_type):
+        return UploadResponse(
+            status="error",
+            error_code="INVALID_FILE_FORMAT",
+            message="Formato de archivo no soportado. Usa: mp4, mkv, webm, avi, mov, flv, wmv"
+        )
+    
+    # Validar parámetros (los enviados antes del archivo)
+    audio_format, audio_quality = _parse_audio_options(form.fields)
     
     # Crear job
-    job_data = db.create_job(
-        video_url=f"upload://{file.filename}",
+    job_data = await db.create_job(
+        video_url=f"upload://{filename}",
         format=audio_format.value,
         quality=audio_quality.value,
         source="upload"
@@ -397,81 +708,78 @@ async def upload_video_file(
     audio_file = None
     
     try:
-        # 1. Guardar archivo temporal
-        db.update_job(job_id, status="processing", progress=10, stage="Recibiendo archivo...")
-        
-        # Crear archivo temporal
-        suffix = Path(file.filename).suffix
-        temp_video_path = Path(tempfile.mktemp(suffix=suffix))
-        
-        # Guardar archivo usando streaming para archivos grandes
-        with open(temp_video_path, "wb") as temp_file:
-            # Leer en chunks de 8MB para evitar problemas de memoria y timeouts
-            while True:
-                chunk = await file.read(8 * 1024 * 1024)  # 8MB chunks
-                if not chunk:
-                    break
-                temp_file.write(chunk)
-        
-        video_size = temp_video_path.stat().st_size
-        video_size_formatted = upload.format_file_size(video_size)
-        
-        # Validar tamaño del archivo
-        settings = get_settings()
-        max_size_bytes = settings.max_file_size_mb * 1024 * 1024
-        if video_size > max_size_bytes:
-            upload.cleanup_file(temp_video_path)
-            db.update_job(
+        # Pipe a FFmpeg solo si el contenedor lo permite y format/quality llegaron antes del archivo
+        if upload.is_streamable_video_file(filename) and _has_audio_options(form.fields):
+            # 1-2. Contenedor apto para pipe: FFmpeg lee el upload por stdin, sin copiar el video a disco
+            await jobs.update_job(job_id, status="extracting", progress=40, stage="Extrayendo audio...")
+            
+            audio_file, video_size, duration = await upload.extract_audio_from_stream(
+                form.iter_file(),
+                filename,
+                audio_format,
+                audio_quality,
+                max_size_bytes,
+            )
+            video_size_formatted = upload.format_file_size(video_size)
+            duration_formatted = video.format_duration(duration) if duration else "Desconocida"
+            
+            await jobs.update_job(
                 job_id,
-                status="failed",
-                error_code="FILE_TOO_LARGE",
-                error_message=f"Archivo muy grande ({video_size_formatted}). Máximo: {settings.max_file_size_mb}MB"
+                video_title=filename,
+                video_duration=duration,
             )
-            return UploadResponse(
-                status="error",
-                error_code="FILE_TOO_LARGE",
-                message=f"Archivo muy grande ({video_size_formatted}). Máximo permitido: {settings.max_file_size_mb}MB",
-                processing_time=round(time.time() - start_time, 2),
+        else:
+            # 1. Guardar archivo temporal
+            await jobs.update_job(job_id, status="processing", progress=10, stage="Recibiendo archivo...")
+            
+            # Crear archivo temporal
+            suffix = Path(filename).suffix
+            temp_video_path = upload.create_temp_video_file(suffix, content_length)
+            
+            # Guardar archivo en streaming (se corta en cuanto supera el máximo)
+            video_size = await upload.save_stream_to_file(form.iter_file(), temp_video_path, max_size_bytes)
+            video_size_formatted = upload.format_file_size(video_size)
+            
+            # Campos enviados después del archivo
+            audio_format, audio_quality = _parse_audio_options(form.fields)
+            
+            # 2. Extraer audio (FFmpeg informa la duración: sin ffprobe aparte)
+            await jobs.update_job(job_id, status="extracting", progress=40, stage="Extrayendo audio...")
+            
+            audio_file, duration = await workers.run_in_process(
+                upload.extract_audio_from_file,
+                temp_video_path,
+                audio_format,
+                audio_quality,
+            )
+            duration_formatted = video.format_duration(duration) if duration else "Desconocida"
+            
+            await jobs.update_job(
+                job_id,
+                video_title=filename,
+                video_duration=duration,
+                format=audio_format.value,
+                quality=audio_quality.value,
             )
-        
-        # Obtener duración
-        duration = upload.get_video_duration(temp_video_path)
-        duration_formatted = video.format_duration(duration) if duration else "Desconocida"
-        
-        db.update_job(
-            job_id,
-            video_title=file.filename,
-            video_duration=duration,
-        )
-        
-        # 2. Extraer audio
-        db.update_job(job_id, status="extracting", progress=40, stage="Extrayendo audio...")
-        
-        audio_file = await asyncio.to_thread(
-            upload.extract_audio_from_file,
-            temp_video_path,
-            audio_format,
-            audio_quality,
-        )
         
         # 3. Subir a Supabase
-        db.update_job(job_id, status="uploading", progress=80, stage="Subiendo...")
+        await jobs.update_job(job_id, status="uploading", progress=80, stage="Subiendo...")
         
-        audio_url = await asyncio.to_thread(storage.upload_file, audio_file)
+        audio_url = await workers.run_in_io_thread(storage.upload_file, audio_file)
         
         # 4. Obtener info del audio
         file_size = audio_file.stat().st_size
         file_size_formatted = upload.format_file_size(file_size)
         
-        # 5. Limpiar archivos temporales
-        upload.cleanup_file(temp_video_path)
-        upload.cleanup_file(audio_file)
+        # 5. Limpiar archivos temporales (después de enviar la respuesta)
+        background_tasks.add_task(upload.cleanup_file, temp_video_path)
+        background_tasks.add_task(upload.cleanup_file, audio_file)
         
         # 6. Calcular tiempo
         processing_time = round(time.time() - start_time, 2)
         
         # 7. Actualizar job
-        db.update_job(
+        await jobs.update_job(
             job_id,
             status="completed",
             progress=100,
@@ -481,11 +789,11 @@ async def upload_video_file(
             processing_time=processing_time,
         )
         
-        print(f"✅ Upload procesado: {audio_url}")
+        logger.info("✅ Upload procesado: %s", audio_url)
         return UploadResponse(
             status="success",
             audio_url=audio_url,
-            filename=file.filename,
+            filename=filename,
             file_size=file_size,
             file_size_formatted=file_size_formatted,
             original_size=video_size,
@@ -499,17 +807,38 @@ async def upload_video_file(
             message="Audio extraído exitosamente",
         )
         
+    except upload.FileTooLargeError as e:
+        processing_time = round(time.time() - start_time, 2)
+        
+        if temp_video_path:
+            background_tasks.add_task(upload.cleanup_file, temp_video_path)
+        
+        await jobs.update_job(
+            job_id,
+            status="failed",
+            error_code="FILE_TOO_LARGE",
+            error_message=str(e),
+            processing_time=processing_time,
+        )
+        
+        return UploadResponse(
+            status="error",
+            error_code="FILE_TOO_LARGE",
+            message=str(e),
+            processing_time=processing_time,
+        )
+        
     except Exception as e:
         processing_time = round(time.time() - start_time, 2)
-        print(f"❌ Error en upload: {str(e)}")
+        logger.error("❌ Error en upload: %s", e)
         
-        # Limpiar archivos temporales
+        # Limpiar archivos temporales (después de enviar la respuesta)
         if temp_video_path:
-            upload.cleanup_file(temp_video_path)
+            background_tasks.add_task(upload.cleanup_file, temp_video_path)
         if audio_file:
-            upload.cleanup_file(audio_file)
+            background_tasks.add_task(upload.cleanup_file, audio_file)
         
-        db.update_job(
+        await jobs.update_job(
             job_id,
             status="failed",
             error_code="EXTRACTION_FAILED",
@@ -525,12 +854,8 @@ async def upload_video_file(
         )
 
 
-@router.post("/upload/download")
-async def upload_and_download(
-    file: UploadFile = File(...),
-    format: str = Form("mp3"),
-    quality: str = Form("192"),
-):
+@router.post("/upload/download", openapi_extra=_UPLOAD_FORM_OPENAPI)
+async def upload_and_download(request: Request):
     """
     **Upload + Download directo** - Sube un video y devuelve el audio directamente.
     Ideal para n8n y automatizaciones que necesitan el binario.
@@ -540,102 +865,107 @@ async def upload_and_download(
     if not storage.is_configured():
         raise HTTPException(status_code=503, detail="Supabase no configurado")
     
-    # Validar formato de archivo
-    if not file.filename or not upload.is_valid_video_file(file.filename):
+    max_size_bytes = upload.MAX_UPLOAD_BYTES
+    
+    # Rechazar antes de leer el body si Content-Length ya supera el máximo
+    content_length = _content_length(request)
+    if content_length > max_size_bytes:
+        raise HTTPException(status_code=413, detail=str(upload.FileTooLargeError(content_length)))
+    
+    # Leer el multipart en streaming hasta el inicio del archivo
+    try:
+        form = upload.MultipartUploadStream(request.headers.get("content-type", ""), request.stream())
+        await form.start()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = form.filename
+    
+    # Validar formato (extensión + Content-Type) antes de leer el contenido
+    if not upload.is_valid_video_upload(filename, form.content_type):
         raise HTTPException(
-            status_code=400,
+            status_code=415,
             detail="Formato de archivo no soportado. Usa: mp4, mkv, webm, avi, mov, flv, wmv"
         )
     
-    # Validar parámetros
-    try:
-        audio_format = AudioFormat(format.lower())
-    except ValueError:
-        audio_format = AudioFormat.MP3
-    
-    try:
-        audio_quality = AudioQuality(quality)
-    except ValueError:
-        audio_quality = AudioQuality.MEDIUM
+    # Validar parámetros (los enviados antes del archivo)
+    audio_format, audio_quality = _parse_audio_options(form.fields)
     
     temp_video_path = None
     audio_file = None
     
     try:
-        # 1. Guardar archivo temporal usando streaming
-        suffix = Path(file.filename).suffix
-        temp_video_path = Path(tempfile.mktemp(suffix=suffix))
-        
-        # Guardar archivo usando streaming para archivos grandes
-        with open(temp_video_path, "wb") as temp_file:
-            # Leer en chunks de 8MB para evitar problemas de memoria y timeouts
-            while True:
-                chunk = await file.read(8 * 1024 * 1024)  # 8MB chunks
-                if not chunk:
-                    break
-                temp_file.write(chunk)
-        
-        # Validar tamaño del archivo
-        settings = get_settings()
-        video_size = temp_video_path.stat().st_size
-        max_size_bytes = settings.max_file_size_mb * 1024 * 1024
-        if video_size > max_size_bytes:
-            upload.cleanup_file(temp_video_path)
-            video_size_formatted = upload.format_file_size(video_size)
-            raise HTTPException(
-                status_code=413,
-                detail=f"Archivo muy grande ({video_size_formatted}). Máximo permitido: {settings.max_file_size_mb}MB"
+        # Pipe a FFmpeg solo si el contenedor lo permite y format/quality llegaron antes del archivo
+        if upload.is_streamable_video_file(filename) and _has_audio_options(form.fields):
+            # 1-2. Contenedor apto para pipe: FFmpeg lee el upload por stdin, sin copiar el video a disco
+            audio_file, _, _ = await upload.extract_audio_from_stream(
+                form.iter_file(),
+                filename,
+                audio_format,
+                audio_quality,
+                max_size_bytes,
+            )
+        else:
+            # 1. Guardar archivo temporal usando streaming
+            suffix = Path(filename).suffix
+            temp_video_path = upload.create_temp_video_file(suffix, content_length)
+            
+            # Guardar archivo en streaming (se corta en cuanto supera el máximo)
+            await upload.save_stream_to_file(form.iter_file(), temp_video_path, max_size_bytes)
+            
+            # Campos enviados después del archivo
+            audio_format, audio_quality = _parse_audio_options(form.fields)
+            
+            # 2. Extraer audio
+            audio_file, _ = await workers.run_in_process(
+                upload.extract_audio_from_file,
+                temp_video_path,
+                audio_format,
+                audio_quality,
             )
         
-        # 2. Extraer audio
-        audio_file = await asyncio.to_thread(
-            upload.extract_audio_from_file,
-            temp_video_path,
-            audio_format,
-            audio_quality,
-        )
-        
-        # 3. Leer audio en memoria
-        with open(audio_file, "rb") as f:
-            audio_data = f.read()
-        
-        file_size = len(audio_data)
+        # 3. Obtener info del audio
+        file_size = audio_file.stat().st_size
         file_size_formatted = upload.format_file_size(file_size)
-        filename = f"{Path(file.filename).stem}.{audio_format.value}"
+        audio_filename = f"{Path(filename).stem}.{audio_format.value}"
         
-        # 4. Subir a Supabase (backup)
-        audio_url = await asyncio.to_thread(storage.upload_file, audio_file)
+        # 4. Subir a Supabase (backup) en paralelo con el envío al cliente, salvo backup=false
+        backup = _parse_bool(form.fields.get("backup"), default=True)
+        audio_url, upload_task = _start_backup_upload(audio_file) if backup else (None, None)
         
-        # 5. Limpiar archivos temporales
-        upload.cleanup_file(temp_video_path)
-        upload.cleanup_file(audio_file)
+        # 5. Al terminar el envío: esperar el backup, eliminar el audio y el video temporal
+        cleanup_tasks = BackgroundTasks()
+        cleanup_tasks.add_task(_finish_backup_upload, upload_task, audio_file)
+        cleanup_tasks.add_task(upload.cleanup_file, temp_video_path)
         
         # 6. Calcular tiempo
         processing_time = round(time.time() - start_time, 2)
         
         # 7. Determinar content type
-        content_types = {
-            "mp3": "audio/mpeg",
-            "m4a": "audio/mp4",
-            "wav": "audio/wav",
-            "opus": "audio/opus"
+        content_type = storage.get_content_type(audio_format.value)
+        
+        headers = {
+            "X-Original-Filename": filename,
+            "X-Processing-Time": str(processing_time),
+            "X-File-Size": file_size_formatted,
         }
-        content_type = content_types.get(audio_format.value, "audio/mpeg")
+        if audio_url:
+            headers["X-Audio-URL"] = audio_url
         
         # 8. Devolver archivo directamente
-        return StreamingResponse(
-            iter([audio_data]),
+        return FileResponse(
+            audio_file,
             media_type=content_type,
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Content-Length": str(file_size),
-                "X-Audio-URL": audio_url,
-                "X-Original-Filename": file.filename,
-                "X-Processing-Time": str(processing_time),
-                "X-File-Size": file_size_formatted,
-            }
+            filename=audio_filename,
+            background=cleanup_tasks,
+            headers=headers,
         )
         
+    except upload.FileTooLargeError as e:
+        if temp_video_path:
+            upload.cleanup_file(temp_video_path)
+        
+        raise HTTPException(status_code=413, detail=str(e))
+        
     except Exception as e:
         # Limpiar archivos temporales
         if temp_video_path:
@@ -673,26 +1003,18 @@ async def start_upload_extraction(
     if not storage.is_configured():
         raise HTTPException(status_code=503, detail="Supabase no configurado")
     
-    # Validar formato de archivo
-    if not file.filename or not upload.is_valid_video_file(file.filename):
+    # Validar formato (extensión + Content-Type)
+    if not upload.is_valid_video_upload(file.filename, file.content_type):
         raise HTTPException(
-            status_code=400,
+            status_code=415,
             detail="Formato de archivo no soportado. Usa: mp4, mkv, webm, avi, mov, flv, wmv"
         )
     
     # Validar parámetros
-    try:
-        audio_format = AudioFormat(format.lower())
-    except ValueError:
-        audio_format = AudioFormat.MP3
-    
-    try:
-        audio_quality = AudioQuality(quality)
-    except ValueError:
-        audio_quality = AudioQuality.MEDIUM
+    audio_format, audio_quality = _audio_options(format, quality)
     
     # Crear job primero
-    job = jobs.create_job(
+    job = await jobs.create_job(
         video_url=f"upload://{file.filename}",
         format=audio_format.value,
         quality=audio_quality.value,
@@ -705,51 +1027,22 @@ async def start_upload_extraction(
         # 1. Guardar archivo temporal usando streaming
         # NOTA: Esta operación puede tardar para archivos grandes, pero es necesaria
         # Los timeouts de nginx deben ser lo suficientemente largos para permitir el upload
-        jobs.update_job(job.job_id, status="processing", progress=5, stage="Recibiendo archivo...")
+        await jobs.update_job(job.job_id, status="processing", progress=5, stage="Recibiendo archivo...")
         
         # Crear archivo temporal
         suffix = Path(file.filename).suffix
-        temp_video_path = Path(tempfile.mktemp(suffix=suffix))
+        temp_video_path = upload.create_temp_video_file(suffix, file.size or 0)
         
-        # Guardar archivo usando streaming para archivos grandes
-        # Leer en chunks más pequeños para mejor progreso y evitar timeouts
-        chunk_size = 2 * 1024 * 1024  # 2MB chunks (más pequeños para mejor progreso)
-        total_written = 0
-        
-        with open(temp_video_path, "wb") as temp_file:
-            while True:
-                chunk = await file.read(chunk_size)
-                if not chunk:
-                    break
-                temp_file.write(chunk)
-                total_written += len(chunk)
-                
-                # Actualizar progreso cada 50MB recibidos
-                if total_written % (50 * 1024 * 1024) < chunk_size:
-                    progress = min(5 + int((total_written / (1024 * 1024 * 1024)) * 5), 10)  # 5-10%
-                    jobs.update_job(job.job_id, progress=progress, stage=f"Recibiendo archivo... ({upload.format_file_size(total_written)})")
-        
-        video_size = temp_video_path.stat().st_size
-        video_size_formatted = upload.format_file_size(video_size)
+        # Guardar archivo (el progreso se reporta cada 50MB recibidos)
+        await _receive_upload_to_file(file, temp_video_path, job.job_id, max_progress=10)
         
         # Validación básica de tamaño (rápida) - validación completa en background
-        settings = get_settings()
-        max_size_bytes = settings.max_file_size_mb * 1024 * 1024
-        if video_size > max_size_bytes:
-            upload.cleanup_file(temp_video_path)
-            jobs.update_job(
-                job.job_id,
-                status="failed",
-                error_code="FILE_TOO_LARGE",
-                error_message=f"Archivo muy grande ({video_size_formatted}). Máximo: {settings.max_file_size_mb}MB"
-            )
-            raise HTTPException(
-                status_code=413,
-                detail=f"Archivo muy grande ({video_size_formatted}). Máximo permitido: {settings.max_file_size_mb}MB"
-            )
+        video_size = temp_video_path.stat().st_size
+        if video_size > upload.MAX_UPLOAD_BYTES:
+            raise upload.FileTooLargeError(video_size)
         
         # Actualizar job con info básica del archivo
-        jobs.update_job(
+        await jobs.update_job(
             job.job_id,
             progress=10,
             video_title=file.filename,
@@ -772,13 +1065,25 @@ async def start_upload_extraction(
     except HTTPException:
         # Re-lanzar HTTPException
         raise
+    except upload.FileTooLargeError as e:
+        if temp_video_path and temp_video_path.exists():
+            upload.cleanup_file(temp_video_path)
+        
+        await jobs.update_job(
+            job.job_id,
+            status="failed",
+            error_code="FILE_TOO_LARGE",
+            error_message=str(e),
+        )
+        
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         # Limpiar archivo temporal si existe
         if temp_video_path and temp_video_path.exists():
             upload.cleanup_file(temp_video_path)
         
         # Marcar job como fallido
-        jobs.update_job(
+        await jobs.update_job(
             job.job_id,
             status="failed",
             error_code="UPLOAD_FAILED",
@@ -803,10 +1108,10 @@ async def start_extraction(request: ExtractRequest, background_tasks: Background
     if not storage.is_configured():
         raise HTTPException(status_code=503, detail="Supabase no configurado")
     
-    job = jobs.create_job(
+    job = await jobs.create_job(
         video_url=request.url,
-        format=request.format.value,
-        quality=request.quality.value,
+        format=request.format,
+        quality=request.quality,
         source="web"
     )
     
@@ -820,13 +1125,13 @@ async def start_extraction(request: ExtractRequest, background_tasks: Background
 @router.get("/jobs", response_model=list[JobResponse])
 async def list_jobs():
     """Lista todos los jobs"""
-    return jobs.get_all_jobs()
+    return await jobs.get_all_jobs()
 
 
 @router.get("/jobs/stats", response_model=StatsResponse)
 async def get_job_stats():
     """Estadísticas de jobs"""
-    stats = jobs.get_stats()
+    stats = await jobs.get_stats()
     return StatsResponse(
         total_jobs=stats["total"],
         completed_jobs=stats["completed"],
@@ -838,7 +1143,7 @@ async def get_job_stats():
 @router.get("/jobs/{job_id}", response_model=JobResponse)
 async def get_job(job_id: str):
     """Obtiene estado de un job"""
-    job = jobs.get_job(job_id)
+    job = await jobs.get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job no encontrado")
     return job
@@ -847,7 +1152,7 @@ async def get_job(job_id: str):
 @router.delete("/jobs/{job_id}")
 async def delete_job(job_id: str):
     """Elimina un job"""
-    if jobs.delete_job(job_id):
+    if await jobs.delete_job(job_id):
         return {"message": "Job eliminado"}
     raise HTTPException(status_code=404, detail="Job no encontrado")
 
@@ -857,35 +1162,35 @@ async def delete_job(job_id: str):
 @router.get("/logs")
 async def get_logs(limit: int = 50):
     """Obtiene historial de jobs"""
-    jobs_list = db.list_jobs(limit=limit)
+    jobs_list = await db.list_jobs(limit=limit)
     return {"total": len(jobs_list), "logs": jobs_list}
 
 
 @router.get("/logs/api")
 async def get_api_logs(limit: int = 50):
     """Jobs desde API"""
-    jobs_list = db.list_jobs(source="api", limit=limit)
+    jobs_list = await db.list_jobs(source="api", limit=limit)
     return {"total": len(jobs_list), "logs": jobs_list}
 
 
 @router.get("/logs/web")
 async def get_web_logs(limit: int = 50):
     """Jobs desde Web"""
-    jobs_list = db.list_jobs(source="web", limit=limit)
+    jobs_list = await db.list_jobs(source="web", limit=limit)
     return {"total": len(jobs_list), "logs": jobs_list}
 
 
 @router.get("/logs/errors")
 async def get_error_logs(limit: int = 50):
     """Jobs con errores"""
-    jobs_list = db.list_jobs(status="failed", limit=limit)
+    jobs_list = await db.list_jobs(status="failed", limit=limit)
     return {"total": len(jobs_list), "logs": jobs_list}
 
 
 @router.get("/logs/stats")
 async def get_logs_stats():
     """Estadísticas"""
-    return db.get_jobs_stats()
+    return await db.get_jobs_stats()
 
 
 # ============== Maintenance ==============
@@ -893,69 +1198,88 @@ async def get_logs_stats():
 @router.post("/cleanup")
 async def cleanup():
     """Limpia archivos y jobs antiguos"""
-    files_cleaned = video.cleanup_old_files()
-    jobs_cleaned = jobs.cleanup_old_jobs()
+    files_cleaned = await asyncio.to_thread(video.cleanup_old_files)
+    jobs_cleaned = await jobs.cleanup_old_jobs()
     return {"files_cleaned": files_cleaned, "jobs_cleaned": jobs_cleaned}
 
 
 # ============== Upload Streaming (Sin timeout) ==============
 
+_QUEUE_FULL_DETAIL = "Servidor ocupado: demasiados uploads en cola. Intenta de nuevo en unos minutos"
+
+
 @router.post("/upload/streaming", response_model=JobResponse)
 async def upload_streaming(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     format: str = Form("mp3"),
     quality: str = Form("192"),
 ):
     """
     **Upload con streaming** - Retorna job_id INMEDIATAMENTE sin esperar el archivo completo.
-    El archivo se recibe y procesa en background. 
+    El archivo se recibe y procesa en la cola de jobs (workers en background). 
     
     VENTAJA: No hay timeout porque el job_id se devuelve en <1 segundo. 
+    Si la cola está llena responde 503 (reintentar más tarde).
     """
     if not storage.is_configured():
         raise HTTPException(status_code=503, detail="Supabase no configurado")
     
-    # Validar formato de archivo
-    if not file.filename or not upload. is_valid_video_file(file.filename):
+    if workers.is_job_queue_full():
+        raise HTTPException(status_code=503, detail=_QUEUE_FULL_DETAIL)
+    
+    # Validar formato (extensión + Content-Type)
+    if not upload.is_valid_video_upload(file.filename, file.content_type):
         raise HTTPException(
-            status_code=400,
+            status_code=415,
             detail="Formato de archivo no soportado. Usa:  mp4, mkv, webm, avi, mov, flv, wmv"
         )
     
     # Validar parámetros
-    try:
-        audio_format = AudioFormat(format.lower())
-    except ValueError:
-        audio_format = AudioFormat. MP3
-    
-    try:
-        audio_quality = AudioQuality(quality)
-    except ValueError:
-        audio_quality = AudioQuality. MEDIUM
+    audio_format, audio_quality = _audio_options(format, quality)
     
     # 1. Crear job INMEDIATAMENTE (esto tarda <1 segundo)
-    job = jobs.create_job(
+    job = await jobs.create_job(
         video_url=f"upload://{file.filename}",
         format=audio_format. value,
         quality=audio_quality.value,
         source="upload-streaming"
     )
     
-    # 2. Recibir y procesar en background
-    background_tasks.add_task(
-        _receive_and_process_file_streaming,
-        job. job_id,
-        file,
-        file.filename,
-        audio_format,
-        audio_quality,
-    )
+    # 2. Encolar recepción y procesamiento (lo atiende un worker, no el request)
+    detached_file = _detach_upload(file)
+    try:
+        workers.submit_job(
+            _receive_and_process_file_streaming,
+            job. job_id,
+            detached_file,
+            file.filename,
+            audio_format,
+            audio_quality,
+        )
+    except workers.JobQueueFull:
+        await detached_file.close()
+        await jobs.update_job(
+            job.job_id,
+            status="failed",
+            error_code="QUEUE_FULL",
+            error_message=_QUEUE_FULL_DETAIL,
+        )
+        raise HTTPException(status_code=503, detail=_QUEUE_FULL_DETAIL)
     
     # 3. RETORNAR JOB INMEDIATAMENTE
     return job
 
 
+def _detach_upload(file: UploadFile) -> UploadFile:
+    """
+    FastAPI cierra los UploadFile al salir del handler, antes de que el worker los procese.
+    Devuelve un UploadFile que conserva el archivo subido; el original queda vacío.
+    """
+    detached = UploadFile(file.file, size=file.size, filename=file.filename, headers=file.headers)
+    file.file = io.BytesIO()
+    return detached
+
+
 async def _receive_and_process_file_streaming(
     job_id: str,
     file: UploadFile,
@@ -968,44 +1292,47 @@ async def _receive_and_process_file_streaming(
     Esta función corre de forma asíncrona, sin bloquear la respuesta HTTP.
     """
     temp_video_path = None
-    audio_file = None
     start_time = time.time()
     
     try:
-        # 1. Recibir archivo
-        jobs.update_job(job_id, status="processing", progress=5, stage="Recibiendo archivo...")
+        # 1. Recibir archivo (sin actualizar el job antes: el progreso llega cada 50MB)
+        settings = get_settings()
+        max_size_bytes = upload.MAX_UPLOAD_BYTES
+        
+        # Contenedores que FFmpeg lee de un pipe: el video va directo a FFmpeg,
+        # sin copiarlo a un archivo temporal ni volver a leerlo
+        if upload.is_streamable_video_file(filename):
+            if file.size and file.size > max_size_bytes:
+                raise upload.FileTooLargeError(file.size)
+            await jobs.process_upload_stream_job(
+                job_id,
+                _iter_upload(file),
+                filename,
+                audio_format,
+                audio_quality,
+                max_size_bytes=max_size_bytes,
+            )
+            return
         
         suffix = Path(filename).suffix
-        temp_video_path = Path(tempfile.mktemp(suffix=suffix))
+        temp_video_path = upload.create_temp_video_file(suffix, file.size or 0)
         
-        chunk_size = 8 * 1024 * 1024  # 8MB chunks
-        total_written = 0
-        
-        with open(temp_video_path, "wb") as temp_file:
-            while True: 
-                chunk = await file.read(chunk_size)
-                if not chunk:
-                    break
-                temp_file.write(chunk)
-                total_written += len(chunk)
-                
-                # Actualizar progreso cada 50MB
-                if total_written % (50 * 1024 * 1024) < chunk_size:
-                    progress = min(5 + int((total_written / (1024 * 1024 * 1024)) * 10), 15)
-                    size_formatted = upload.format_file_size(total_written)
-                    jobs.update_job(job_id, progress=progress, stage=f"Recibiendo...  ({size_formatted})")
+        await _receive_upload_to_file(file, temp_video_path, job_id, max_progress=15)
         
         video_size = temp_video_path.stat().st_size
         video_size_formatted = upload.format_file_size(video_size)
         
         # Validar tamaño
-        settings = get_settings()
-        max_size_bytes = settings.max_file_size_mb * 1024 * 1024
         if video_size > max_size_bytes:
             raise ValueError(f"Archivo muy grande ({video_size_formatted}). Máximo: {settings.max_file_size_mb}MB")
         
-        # 2. Actualizar job con info básica
-        jobs.update_job(job_id, progress=15, video_title=filename)
+        # 2. Archivo recibido (video_title y duración los guarda process_upload_job)
+        await jobs.update_job(
+            job_id,
+            status="processing",
+            progress=15,
+            stage=f"Recibido ({video_size_formatted})",
+        )
         
         # 3. Procesar usando la función existente
         await jobs.process_upload_job(
@@ -1022,13 +1349,13 @@ async def _receive_and_process_file_streaming(
         # Limpiar archivos temporales
         if temp_video_path and temp_video_path.exists():
             upload.cleanup_file(temp_video_path)
-        if audio_file and audio_file.exists():
-            upload. cleanup_file(audio_file)
         
-        jobs.update_job(
+        await jobs.update_job(
             job_id,
             status="failed",
             error_code="STREAMING_UPLOAD_FAILED",
             error_message=str(e),
             processing_time=processing_time,
         )
+    finally:
+        await file.close()
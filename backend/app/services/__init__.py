@@ -1,6 +1,6 @@
 """
 Servicios de la aplicación
 """
-from . import video, storage, jobs, db, upload
+from . import video, storage, jobs, db, upload, workers
 
-__all__ = ["video", "storage", "jobs", "db", "upload"]
+__all__ = ["video", "storage", "jobs", "db", "upload", "workers"]
@@ -1,21 +1,45 @@
 """
-Servicio de base de datos - Jobs en Supabase
+Servicio de base de datos - Jobs en Supabase (cliente async)
 """
-from datetime import datetime
+import logging
+import time
+from datetime import datetime, timezone
 from typing import Optional
 from uuid import uuid4
 
-from .storage import get_supabase_client
+from postgrest.exceptions import APIError
+from postgrest.types import CountMethod, ReturnMethod
 
+from .storage import get_async_supabase_client
 
-def create_job(
+
+logger = logging.getLogger(__name__)
+
+# Caché de get_jobs_stats: /jobs/stats y /logs/stats se consultan seguido desde el dashboard
+STATS_TTL_SECONDS = 10
+_stats_cache: Optional[tuple[float, dict]] = None
+
+# False si la RPC get_jobs_stats no existe en la base: no se reintenta hasta reiniciar.
+# Otros errores (timeout, 5xx) no la desactivan
+_stats_rpc_available = True
+
+# PostgREST responde 404 / PGRST202 cuando la función no existe
+_RPC_NOT_FOUND_CODES = {"PGRST202", "404", 404}
+
+_ACTIVE_STATUSES = {"processing", "downloading", "extracting", "uploading"}
+
+
+async def create_job(
     video_url: str,
     format: str = "mp3",
     quality: str = "192",
     source: str = "api"
 ) -> dict:
-    """Crea un nuevo job en Supabase"""
-    client = get_supabase_client()
+    """
+    Crea un nuevo job en Supabase.
+    id y created_at se generan aquí: el INSERT no necesita devolver la fila (return=minimal).
+    """
+    client = await get_async_supabase_client()
     
     job_id = str(uuid4())
     
@@ -28,87 +52,140 @@ def create_job(
         "format": format,
         "quality": quality,
         "source": source,
+        "created_at": datetime.now(timezone.utc).isoformat(),
     }
     
-    result = client.table("jobs").insert(data).execute()
+    await client.table("jobs").insert(data, returning=ReturnMethod.minimal).execute()
     
-    return result.data[0] if result.data else data
+    return data
 
 
-def get_job(job_id: str) -> Optional[dict]:
+async def get_job(job_id: str) -> Optional[dict]:
     """Obtiene un job por ID"""
-    client = get_supabase_client()
+    client = await get_async_supabase_client()
     
-    result = client.table("jobs").select("*").eq("id", job_id).execute()
+    result = await client.table("jobs").select("*").eq("id", job_id).execute()
     
     return result.data[0] if result.data else None
 
 
-def update_job(job_id: str, **kwargs) -> Optional[dict]:
+async def update_job(job_id: str, **kwargs) -> Optional[dict]:
     """Actualiza un job"""
-    client = get_supabase_client()
+    client = await get_async_supabase_client()
     
-    kwargs["updated_at"] = datetime.now().isoformat()
+    kwargs["updated_at"] = datetime.now(timezone.utc).isoformat()
     
-    result = client.table("jobs").update(kwargs).eq("id", job_id).execute()
+    result = await client.table("jobs").update(kwargs).eq("id", job_id).execute()
     
     return result.data[0] if result.data else None
 
 
-def list_jobs(
+async def list_jobs(
     status: Optional[str] = None,
     source: Optional[str] = None,
     limit: int = 50
 ) -> list[dict]:
     """Lista jobs con filtros opcionales"""
-    client = get_supabase_client()
+    client = await get_async_supabase_client()
     
-    query = client.table("jobs").select("*").order("created_at", desc=True).limit(limit)
+    # Filtros antes del orden: coinciden con los índices (status|source, created_at DESC), ver README
+    query = client.table("jobs").select("*")
     
     if status:
         query = query.eq("status", status)
     if source:
         query = query.eq("source", source)
     
-    result = query.execute()
+    result = await query.order("created_at", desc=True).limit(limit).execute()
     
     return result.data or []
 
 
-def get_jobs_stats() -> dict:
-    """Obtiene estadísticas de jobs"""
-    client = get_supabase_client()
-    
-    all_jobs = client.table("jobs").select("status, source").execute()
-    jobs = all_jobs.data or []
-    
-    return {
-        "total": len(jobs),
-        "pending": sum(1 for j in jobs if j["status"] == "pending"),
-        "processing": sum(1 for j in jobs if j["status"] in ["processing", "downloading", "extracting", "uploading"]),
-        "completed": sum(1 for j in jobs if j["status"] == "completed"),
-        "failed": sum(1 for j in jobs if j["status"] == "failed"),
-        "api_total": sum(1 for j in jobs if j["source"] == "api"),
-        "web_total": sum(1 for j in jobs if j["source"] == "web"),
+async def _count_jobs_by_status_source() -> list[dict]:
+    """
+    Conteo de jobs agrupado por (status, source), calculado en Postgres con la función
+    get_jobs_stats (ver README). Si la función no existe, cuenta fila por fila
+    (y no la vuelve a intentar); ante otros errores cuenta fila por fila solo esa vez.
+    """
+    global _stats_rpc_available
+    
+    client = await get_async_supabase_client()
+    
+    if _stats_rpc_available:
+        try:
+            return (await client.rpc("get_jobs_stats").execute()).data or []
+        except Exception as e:
+            if isinstance(e, APIError) and e.code in _RPC_NOT_FOUND_CODES:
+                _stats_rpc_available = False
+                logger.warning("⚠️ RPC get_jobs_stats no existe, contando en Python: %s", e)
+            else:
+                # Error pasajero (timeout, 5xx): se cuenta en Python solo esta vez
+                logger.warning("⚠️ RPC get_jobs_stats falló, contando en Python: %s", e)
+    
+    all_jobs = await client.table("jobs").select("status, source").execute()
+    return [{"status": j["status"], "source": j["source"], "total": 1} for j in all_jobs.data or []]
+
+
+async def get_jobs_stats() -> dict:
+    """Obtiene estadísticas de jobs (cacheadas STATS_TTL_SECONDS)"""
+    global _stats_cache
+    
+    now = time.monotonic()
+    if _stats_cache and now - _stats_cache[0] < STATS_TTL_SECONDS:
+        return dict(_stats_cache[1])
+    
+    stats = {
+        "total": 0,
+        "pending": 0,
+        "processing": 0,
+        "completed": 0,
+        "failed": 0,
+        "api_total": 0,
+        "web_total": 0,
     }
+    
+    for group in await _count_jobs_by_status_source():
+        total = group["total"]
+        status = group["status"]
+        stats["total"] += total
+        
+        if status in _ACTIVE_STATUSES:
+            stats["processing"] += total
+        elif status in ("pending", "completed", "failed"):
+            stats[status] += total
+        
+        if group["source"] in ("api", "web"):
+            stats[f"{group['source']}_total"] += total
+    
+    _stats_cache = (now, stats)
+    return dict(stats)
 
 
-def delete_job(job_id: str) -> bool:
+async def delete_job(job_id: str) -> bool:
     """Elimina un job"""
-    client = get_supabase_client()
+    client = await get_async_supabase_client()
     
-    result = client.table("jobs").delete().eq("id", job_id).execute()
+    result = await client.table("jobs").delete().eq("id", job_id).execute()
     
     return len(result.data) > 0 if result.data else False
 
 
-def cleanup_old_jobs(hours: int = 24) -> int:
-    """Elimina jobs completados/fallidos más antiguos que X horas"""
-    client = get_supabase_client()
+async def cleanup_old_jobs(hours: int = 24) -> int:
+    """
+    Elimina jobs completados/fallidos más antiguos que X horas.
+    PostgREST devuelve solo el conteo (Content-Range), no las filas borradas.
+    """
+    client = await get_async_supabase_client()
     
     from datetime import timedelta
-    cutoff = (datetime.now() - timedelta(hours=hours)).isoformat()
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
     
-    result = client.table("jobs").delete().lt("created_at", cutoff).in_("status", ["completed", "failed"]).execute()
+    result = await (
+        client.table("jobs")
+        .delete(count=CountMethod.exact, returning=ReturnMethod.minimal)
+        .lt("created_at", cutoff)
+        .in_("status", ["completed", "failed"])
+        .execute()
+    )
     
-    return len(result.data) if result.data else 0
+    return result.count or 0
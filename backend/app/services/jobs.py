@@ -2,11 +2,14 @@
 Servicio de gestión de trabajos de extracción
 """
 import asyncio
+import logging
 import time
 from datetime import datetime
-
+from functools import lru_cache
 from pathlib import Path
+from typing import AsyncIterator, Optional
 
+from ..config import get_settings
 from ..models import (
     AudioFormat,
     AudioQuality,
@@ -16,12 +19,36 @@ from ..models import (
     JobStatus,
     VideoInfo,
 )
-from . import video, storage, db, upload
+from . import video, storage, db, upload, workers
+
+
+logger = logging.getLogger(__name__)
+
+# Progreso de los jobs en curso (status/progress/stage), solo en memoria.
+# A Supabase se escribe el primer cambio de estado, los datos del video y el estado final.
+_live_state: dict[str, dict] = {}
+
+_PROGRESS_FIELDS = {"status", "progress", "stage"}
+_FINAL_STATUSES = {"completed", "failed"}
 
+# Limita los jobs procesándose a la vez (se crea con el event loop ya corriendo)
+_job_slots: Optional[asyncio.Semaphore] = None
+
+
+@lru_cache(maxsize=1024)
+def _parse_ts_ms(created_at: str) -> int:
+    """
+    created_at de Supabase (ISO en UTC) → epoch-ms.
+    Cacheado: /jobs devuelve las mismas filas en cada consulta.
+    """
+    if created_at.endswith("Z"):
+        created_at = created_at[:-1] + "+00:00"
+    return int(datetime.fromisoformat(created_at).timestamp() * 1000)
 
-def create_job(video_url:  str, format: str, quality: str, source: str = "web") -> JobResponse:
+
+async def create_job(video_url:  str, format: str, quality: str, source: str = "web") -> JobResponse:
     """Crea un nuevo job en Supabase"""
-    job_data = db.create_job(
+    job_data = await db.create_job(
         video_url=video_url,
         format=format,
         quality=quality,
@@ -33,120 +60,211 @@ def create_job(video_url:  str, format: str, quality: str, source: str = "web")
         status=JobStatus. PENDING,
         progress=0,
         message="Iniciando.. .",
-        created_at=datetime.fromisoformat(job_data["created_at"]. replace("Z", "+00:00")) if isinstance(job_data["created_at"], str) else job_data["created_at"],
+        created_at_ms=_parse_ts_ms(job_data["created_at"]),
     )
 
 
-def get_job(job_id: str) -> JobResponse | None:
+async def get_job(job_id: str) -> JobResponse | None:
     """Obtiene un job de Supabase"""
-    job_data = db.get_job(job_id)
+    job_data = await db.get_job(job_id)
     
     if not job_data: 
         return None
     
+    return _row_to_response(job_data)
+
+
+def _row_to_response(job_data: dict) -> JobResponse:
+    """
+    Construye el JobResponse de una fila de la tabla jobs.
+    Los datos vienen de Supabase: se usa model_construct (sin validar) y solo se
+    convierte el status, que debe ser un JobStatus válido.
+    """
+    # Progreso en memoria (más reciente que lo guardado en Supabase)
+    live_state = _live_state.get(job_data["id"])
+    if live_state:
+        job_data = {**job_data, **live_state}
+    
+    g = job_data.get
+    status = JobStatus(job_data["status"])
+    
     # ✅ CAMBIO:  Construir video_info solo si hay datos válidos
     video_info = None
     # Verificar que al menos tengamos id y source (campos requeridos antes)
-    if job_data.get("video_id") or job_data.get("video_title"):
-        video_info = VideoInfo(
-            id=job_data. get("video_id"),  # Puede ser None ahora
-            title=job_data.get("video_title"),
-            duration_seconds=job_data.get("video_duration"),
-            duration_formatted=video.format_duration(job_data.get("video_duration")) if job_data.get("video_duration") else None,
-            thumbnail=job_data.get("video_thumbnail"),
-            source=job_data.get("video_source"),  # Puede ser None ahora
-            channel=job_data.get("video_channel"),
+    video_id = g("video_id")
+    video_title = g("video_title")
+    if video_id or video_title:
+        duration = g("video_duration")
+        video_info = VideoInfo.model_construct(
+            id=video_id,  # Puede ser None ahora
+            title=video_title,
+            duration_seconds=duration,
+            duration_formatted=video.format_duration(duration) if duration else None,
+            thumbnail=g("video_thumbnail"),
+            source=g("video_source"),  # Puede ser None ahora
+            channel=g("video_channel"),
         )
     
     # Construir result si completado o fallido
     result = None
-    if job_data["status"] == "completed" and job_data. get("audio_url"):
-        result = ExtractResult(
+    if status is JobStatus.COMPLETED and g("audio_url"):
+        result = ExtractResult.model_construct(
             success=True,
             audio_url=job_data["audio_url"],
-            file_size=job_data.get("file_size"),
-            format=job_data.get("format", "mp3").upper(),
-            quality=f"{job_data.get('quality', '192')} kbps",
+            file_size=g("file_size"),
+            format=g("format", "mp3").upper(),
+            quality=f"{g('quality', '192')} kbps",
         )
-    elif job_data["status"] == "failed":
-        result = ExtractResult(
+    elif status is JobStatus.FAILED:
+        result = ExtractResult.model_construct(
             success=False,
-            error=job_data.get("error_message", "Error desconocido"),
+            error=g("error_message", "Error desconocido"),
         )
     
-    created_at = job_data["created_at"]
-    if isinstance(created_at, str):
-        created_at = datetime.fromisoformat(created_at. replace("Z", "+00:00"))
-    
-    return JobResponse(
+    return JobResponse.model_construct(
         job_id=job_data["id"],
-        status=JobStatus(job_data["status"]),
-        progress=job_data.get("progress", 0),
-        message=job_data.get("stage", ""),
-        created_at=created_at,
+        status=status,
+        progress=g("progress") or 0,
+        message=g("stage") or "",
+        created_at_ms=_parse_ts_ms(job_data["created_at"]),
         video_info=video_info,  # Puede ser None ahora
         result=result,
     )
 
 
-def update_job(job_id: str, **kwargs) -> None:
-    """Actualiza un job en Supabase"""
-    db.update_job(job_id, **kwargs)
+def _take_live_fields(job_id: str, fields: dict) -> dict:
+    """
+    Guarda en memoria el progreso intermedio (status/progress/stage) y devuelve
+    los campos que hay que escribir en Supabase (todos si el estado es final).
+    """
+    if fields.get("status") in _FINAL_STATUSES:
+        return fields
+    
+    live_state = _live_state.setdefault(job_id, {})
+    
+    # Primer cambio de estado: se guarda para que /jobs y las estadísticas lo vean
+    persist_status = "status" in fields and "status" not in live_state
+    
+    db_fields = {}
+    for field, value in fields.items():
+        if field in _PROGRESS_FIELDS:
+            live_state[field] = value
+        else:
+            db_fields[field] = value
+    
+    if persist_status:
+        db_fields["status"] = fields["status"]
+    
+    return db_fields
+
+
+def _release_live_state(job_id: str, fields: dict) -> None:
+    """Descarta el progreso en memoria cuando el estado final ya está en Supabase"""
+    if fields.get("status") in _FINAL_STATUSES:
+        _live_state.pop(job_id, None)
+
+
+async def update_job(job_id: str, **kwargs) -> None:
+    """
+    Actualiza un job. El progreso intermedio (status/progress/stage) queda en memoria;
+    en Supabase solo se guarda el primer estado, los demás campos y el estado final.
+    """
+    db_fields = _take_live_fields(job_id, kwargs)
+    if db_fields:
+        await db.update_job(job_id, **db_fields)
+    _release_live_state(job_id, kwargs)
 
 
-def delete_job(job_id: str) -> bool:
+async def delete_job(job_id: str) -> bool:
     """Elimina un job"""
-    return db.delete_job(job_id)
+    _live_state.pop(job_id, None)
+    return await db.delete_job(job_id)
 
 
-def get_all_jobs(limit: int = 50) -> list[JobResponse]:
+async def get_all_jobs(limit: int = 50) -> list[JobResponse]:
     """
     Obtiene todos los jobs
     ✅ CAMBIO:  Manejo de errores para jobs con datos incompletos
     """
-    jobs_data = db.list_jobs(limit=limit)
+    jobs_data = await db.list_jobs(limit=limit)
     result = []
     
+    # Las filas de list_jobs ya traen todas las columnas: sin una consulta extra por job
     for j in jobs_data:
         try:
-            job = get_job(j["id"])
-            if job:
-                result.append(job)
+            result.append(_row_to_response(j))
         except Exception as e:
             # Log error pero continuar con los demás jobs
-            print(f"⚠️ Error al obtener job {j. get('id', 'unknown')}: {e}")
+            logger.warning("⚠️ Error al obtener job %s: %s", j. get('id', 'unknown'), e)
             continue
     
     return result
 
 
-def get_stats() -> dict:
+async def get_stats() -> dict:
     """Obtiene estadísticas de jobs"""
-    return db.get_jobs_stats()
+    return await db.get_jobs_stats()
 
 
-def cleanup_old_jobs(max_age_hours: int = 24) -> int:
+async def cleanup_old_jobs(max_age_hours: int = 24) -> int:
     """Limpia jobs antiguos"""
-    return db.cleanup_old_jobs(max_age_hours)
+    return await db.cleanup_old_jobs(max_age_hours)
+
+
+def _put_latest(queue: asyncio.Queue, fields: dict) -> None:
+    """Encola un avance de progreso; si hay uno pendiente se reemplaza (gana el último)"""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(fields)
+
+
+async def _progress_writer(job_id: str, queue: asyncio.Queue) -> None:
+    """Aplica los avances de progreso de un job en orden hasta recibir None"""
+    while (fields := await queue.get()) is not None:
+        try:
+            await update_job(job_id, **fields)
+        except Exception as e:
+            logger.warning("⚠️ Error al actualizar progreso del job %s: %s", job_id[:8], e)
+
+
+def _get_job_slots() -> asyncio.Semaphore:
+    """Semáforo de settings.max_concurrent_jobs (singleton)"""
+    global _job_slots
+    
+    if _job_slots is None:
+        _job_slots = asyncio.Semaphore(get_settings().max_concurrent_jobs)
+    
+    return _job_slots
 
 
 async def process_job(job_id: str, request: ExtractRequest) -> None:
     """
-    Procesa un job de extracción de forma asíncrona
+    Procesa un job de extracción de forma asíncrona.
+    Espera turno en el semáforo de jobs: mientras tanto el job sigue "pending".
     """
+    async with _get_job_slots():
+        await _process_job(job_id, request)
+
+
+async def _process_job(job_id: str, request: ExtractRequest) -> None:
+    """Descarga, extrae y sube el audio de un job de extracción"""
     start_time = time.time()
+    storage_warm_up: Optional[asyncio.Task] = None
     
     try:
-        print(f"🚀 Iniciando job {job_id[:8]} - URL: {request.url}")
+        logger.info("🚀 Iniciando job %s - URL: %s", job_id[:8], request.url)
         
         # 1. Obtener info del video
-        update_job(job_id, status="processing", progress=5, stage="Obteniendo información del video...")
+        await update_job(job_id, status="processing", progress=5, stage="Obteniendo información del video...")
         
-        info = await asyncio.to_thread(video.get_video_info, request.url)
-        print(f"📊 Video: {info.title} ({info.duration_formatted})")
+        # La conexión con Storage se abre mientras se obtiene la info del video
+        storage_warm_up = asyncio.create_task(workers.run_in_io_thread(storage.warm_up_http_session))
+        
+        info = await workers.run_in_io_thread(video.get_video_info, request.url)
+        logger.info("📊 Video: %s (%s)", info.title, info.duration_formatted)
         
         # Guardar info del video
-        update_job(
+        await update_job(
             job_id,
             progress=10,
             video_title=info.title,
@@ -157,28 +275,50 @@ async def process_job(job_id: str, request: ExtractRequest) -> None:
             video_channel=info.channel,
         )
         
-        # 2. Callback para progreso
+        # 2. Callback para progreso (corre en el hilo de yt-dlp): deja el último
+        #    avance en una cola que consume un único writer en el event loop
+        loop = asyncio.get_running_loop()
+        progress_queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        writer = asyncio.create_task(_progress_writer(job_id, progress_queue))
+        last_progress = {"stage": None, "percent": -1}
+        
         def on_progress(stage: str, percent: int):
+            # yt-dlp llama al hook muchas veces por segundo: se descartan los ticks
+            # que no avanzan al menos 1% dentro de la misma etapa
+            if stage == last_progress["stage"] and percent - last_progress["percent"] < 1:
+                return
+            
             if stage == "downloading":
-                update_job(job_id, status="downloading", progress=10 + percent, stage="Descargando video...")
-            elif stage == "extracting": 
-                update_job(job_id, status="extracting", progress=percent, stage="Extrayendo audio...")
+                fields = {"status": "downloading", "progress": 10 + percent, "stage": "Descargando video..."}
+            elif stage == "extracting":
+                fields = {"status": "extracting", "progress": percent, "stage": "Extrayendo audio..."}
+            else:
+                return
+            last_progress["stage"] = stage
+            last_progress["percent"] = percent
+            loop.call_soon_threadsafe(_put_latest, progress_queue, fields)
         
         # 3. Descargar y extraer
-        update_job(job_id, status="downloading", progress=15, stage="Descargando video...")
-        
-        audio_file, video_info = await asyncio.to_thread(
-            video.download_and_extract,
-            request.url,
-            request.format,
-            request.quality,
-            on_progress,
-        )
+        await update_job(job_id, status="downloading", progress=15, stage="Descargando video...")
+        
+        try:
+            audio_file, video_info = await workers.run_in_extract_thread(
+                video.download_and_extract,
+                request.url,
+                AudioFormat(request.format),
+                AudioQuality(request.quality),
+                on_progress,
+            )
+        finally:
+            # Vaciar el último progreso pendiente antes de seguir con el job
+            await progress_queue.put(None)
+            await writer
         
         # 4. Subir a Supabase
-        update_job(job_id, status="uploading", progress=92, stage="Subiendo a la nube...")
+        await update_job(job_id, status="uploading", progress=92, stage="Subiendo a la nube...")
         
-        audio_url = await asyncio.to_thread(storage.upload_file, audio_file)
+        await storage_warm_up
+        audio_url = await workers.run_in_io_thread(storage.upload_file, audio_file)
         
         # 5. Obtener tamaño del archivo
         file_size = video.format_file_size(audio_file.stat().st_size)
@@ -190,8 +330,8 @@ async def process_job(job_id: str, request: ExtractRequest) -> None:
         processing_time = round(time.time() - start_time, 2)
         
         # 8. Completar job
-        print(f"✅ Job {job_id[:8]} completado en {processing_time}s")
-        update_job(
+        logger.info("✅ Job %s completado en %ss", job_id[:8], processing_time)
+        await update_job(
             job_id,
             status="completed",
             progress=100,
@@ -203,9 +343,9 @@ async def process_job(job_id: str, request: ExtractRequest) -> None:
         
     except Exception as e:
         processing_time = round(time.time() - start_time, 2)
-        print(f"❌ Job {job_id[:8]} falló después de {processing_time}s: {str(e)}")
+        logger.error("❌ Job %s falló después de %ss: %s", job_id[:8], processing_time, e)
         
-        update_job(
+        await update_job(
             job_id,
             status="failed",
             progress=0,
@@ -214,6 +354,11 @@ async def process_job(job_id: str, request: ExtractRequest) -> None:
             error_message=str(e),
             processing_time=processing_time,
         )
+    finally:
+        # Si el job falló antes de subir, el calentamiento queda sin esperar
+        if storage_warm_up is not None:
+            storage_warm_up.cancel()
+            await asyncio.gather(storage_warm_up, return_exceptions=True)
 
 
 async def process_upload_job(
@@ -225,59 +370,51 @@ async def process_upload_job(
 ) -> None:
     """
     Procesa un job de upload de forma asíncrona
-    Similar a process_job pero para archivos subidos
+    Similar a process_job pero para archivos subidos (comparte el semáforo de jobs)
     """
+    async with _get_job_slots():
+        await _process_upload_job(job_id, video_file_path, filename, audio_format, audio_quality)
+
+
+async def _process_upload_job(
+    job_id: str,
+    video_file_path: Path,
+    filename: str,
+    audio_format: AudioFormat,
+    audio_quality: AudioQuality,
+) -> None:
+    """Valida, extrae y sube el audio de un archivo subido"""
     start_time = time.time()
     temp_video_path = video_file_path
     audio_file = None
     
     try:
-        print(f"📤 Procesando upload job {job_id[:8]} - Archivo: {filename}")
+        logger.info("📤 Procesando upload job %s - Archivo: %s", job_id[:8], filename)
         
         # 1. Validar archivo
-        update_job(job_id, status="processing", progress=5, stage="Validando archivo...")
+        await update_job(job_id, status="processing", progress=5, stage="Validando archivo...")
         
         if not temp_video_path.exists():
             raise FileNotFoundError("Archivo temporal no encontrado")
         
-        # 2. Obtener información del video
-        update_job(job_id, status="processing", progress=10, stage="Analizando video...")
-        
-        duration = await asyncio.to_thread(upload.get_video_duration, temp_video_path)
-        duration_formatted = video.format_duration(duration) if duration else "Desconocida"
-        
+        # 2. Obtener información del video (la duración la valida FFmpeg al extraer)
         video_size = temp_video_path.stat().st_size
         video_size_formatted = upload.format_file_size(video_size)
         
-        # Guardar info del video
-        update_job(
-            job_id,
-            progress=15,
-            video_title=filename,
-            video_duration=duration,
-        )
-        
-        # Validar duración
-        from ..config import get_settings
-        settings = get_settings()
-        if duration and duration > settings.max_duration_minutes * 60:
-            raise ValueError(
-                f"Video muy largo ({duration // 60} min). "
-                f"Máximo permitido: {settings.max_duration_minutes} min"
-            )
+        await update_job(job_id, status="processing", progress=15, video_title=filename)
         
         # Validar tamaño
-        max_size_bytes = settings.max_file_size_mb * 1024 * 1024
-        if video_size > max_size_bytes:
+        settings = get_settings()
+        if video_size > upload.MAX_UPLOAD_BYTES:
             raise ValueError(
                 f"Archivo muy grande ({video_size_formatted}). "
                 f"Máximo permitido: {settings.max_file_size_mb}MB"
             )
         
         # 3. Extraer audio
-        update_job(job_id, status="extracting", progress=20, stage="Extrayendo audio...")
+        await update_job(job_id, status="extracting", progress=20, stage="Extrayendo audio...")
         
-        audio_file = await asyncio.to_thread(
+        audio_file, duration = await workers.run_in_process(
             upload.extract_audio_from_file,
             temp_video_path,
             audio_format,
@@ -285,9 +422,15 @@ async def process_upload_job(
         )
         
         # 4. Subir a Supabase
-        update_job(job_id, status="uploading", progress=85, stage="Subiendo a la nube...")
+        await update_job(
+            job_id,
+            status="uploading",
+            progress=85,
+            stage="Subiendo a la nube...",
+            video_duration=duration,
+        )
         
-        audio_url = await asyncio.to_thread(storage.upload_file, audio_file)
+        audio_url = await workers.run_in_io_thread(storage.upload_file, audio_file)
         
         # 5. Obtener tamaño del archivo de audio
         file_size = audio_file.stat().st_size
@@ -301,8 +444,8 @@ async def process_upload_job(
         processing_time = round(time.time() - start_time, 2)
         
         # 8. Completar job
-        print(f"✅ Upload job {job_id[:8]} completado en {processing_time}s - {file_size_formatted}")
-        update_job(
+        logger.info("✅ Upload job %s completado en %ss - %s", job_id[:8], processing_time, file_size_formatted)
+        await update_job(
             job_id,
             status="completed",
             progress=100,
@@ -314,7 +457,7 @@ async def process_upload_job(
         
     except Exception as e: 
         processing_time = round(time.time() - start_time, 2)
-        print(f"❌ Upload job {job_id[:8]} falló: {str(e)}")
+        logger.error("❌ Upload job %s falló: %s", job_id[:8], e)
         
         # Limpiar archivos temporales en caso de error
         if temp_video_path and temp_video_path.exists():
@@ -322,7 +465,94 @@ async def process_upload_job(
         if audio_file and audio_file.exists():
             upload.cleanup_file(audio_file)
         
-        update_job(
+        await update_job(
+            job_id,
+            status="failed",
+            progress=0,
+            stage="Error",
+            error_code="UPLOAD_EXTRACTION_FAILED",
+            error_message=str(e),
+            processing_time=processing_time,
+        )
+
+
+async def process_upload_stream_job(
+    job_id: str,
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    audio_format: AudioFormat,
+    audio_quality: AudioQuality,
+    max_size_bytes: Optional[int] = None,
+) -> None:
+    """
+    Procesa un job de upload enviando el video directo al stdin de FFmpeg,
+    sin escribirlo en un archivo temporal (solo contenedores que FFmpeg lee de un pipe).
+    Comparte el semáforo de jobs: el FFmpeg del pipe cuenta en MAX_CONCURRENT_JOBS
+    """
+    async with _get_job_slots():
+        await _process_upload_stream_job(
+            job_id, chunks, filename, audio_format, audio_quality, max_size_bytes
+        )
+
+
+async def _process_upload_stream_job(
+    job_id: str,
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    audio_format: AudioFormat,
+    audio_quality: AudioQuality,
+    max_size_bytes: Optional[int],
+) -> None:
+    """Extrae el audio del video recibido por el pipe de FFmpeg y lo sube"""
+    start_time = time.time()
+    audio_file = None
+    
+    try:
+        logger.info("📤 Procesando upload job %s (pipe) - Archivo: %s", job_id[:8], filename)
+        
+        # 1. Extraer audio mientras se lee el video
+        await update_job(
+            job_id,
+            status="extracting",
+            progress=20,
+            stage="Extrayendo audio...",
+            video_title=filename,
+        )
+        
+        audio_file, _, duration = await upload.extract_audio_from_stream(
+            chunks,
+            filename,
+            audio_format,
+            audio_quality,
+            max_size_bytes=max_size_bytes,
+        )
+        
+        # 2. Subir a Supabase
+        await update_job(job_id, status="uploading", progress=85, stage="Subiendo a la nube...")
+        
+        audio_url = await workers.run_in_io_thread(storage.upload_file, audio_file)
+        
+        file_size_formatted = upload.format_file_size(audio_file.stat().st_size)
+        processing_time = round(time.time() - start_time, 2)
+        
+        # 3. Completar job
+        logger.info("✅ Upload job %s completado en %ss - %s", job_id[:8], processing_time, file_size_formatted)
+        await update_job(
+            job_id,
+            status="completed",
+            progress=100,
+            stage="¡Audio extraído exitosamente!",
+            video_duration=duration,
+            audio_url=audio_url,
+            file_size=file_size_formatted,
+            processing_time=processing_time,
+        )
+        
+    except Exception as e:
+        processing_time = round(time.time() - start_time, 2)
+        logger.error("❌ Upload job %s falló: %s", job_id[:8], e)
+        
+        await update_job(
             job_id,
             status="failed",
             progress=0,
@@ -331,3 +561,7 @@ async def process_upload_job(
             error_message=str(e),
             processing_time=processing_time,
         )
+    
+    finally:
+        if audio_file:
+            upload.cleanup_file(audio_file)
@@ -1,7 +1,9 @@
 """
 Servicio de logs de ejecución
 """
-from datetime import datetime
+import time
+from collections import Counter, deque
+from itertools import islice
 from typing import Optional
 from uuid import uuid4
 
@@ -9,8 +11,11 @@ from ..models import ExecutionLog, ExecutionSource
 
 
 # Almacén en memoria de logs (en producción usar base de datos)
-_logs: list[ExecutionLog] = []
 MAX_LOGS = 100  # Máximo de logs a mantener
+# deque con maxlen: insertar al inicio es O(1) y descarta solo el log más antiguo
+_logs: deque[ExecutionLog] = deque(maxlen=MAX_LOGS)
+# Conteo por (origen, status) de los logs en _logs, mantenido en add_log: get_stats es O(1)
+_counts: Counter[tuple[ExecutionSource, str]] = Counter()
 
 
 def add_log(
@@ -31,7 +36,7 @@ def add_log(
     log = ExecutionLog(
         id=str(uuid4())[:8],
         source=source,
-        timestamp=datetime.now(),
+        timestamp_ms=int(time.time() * 1000),
         video_url=video_url,
         video_title=video_title,
         status=status,
@@ -45,24 +50,26 @@ def add_log(
         error_message=error_message,
     )
     
-    _logs.insert(0, log)  # Insertar al inicio (más reciente primero)
+    # Si el deque está lleno, appendleft descarta el más antiguo: descontarlo
+    if len(_logs) == MAX_LOGS:
+        evicted = _logs[-1]
+        _counts[(evicted.source, evicted.status)] -= 1
     
-    # Limitar cantidad de logs
-    if len(_logs) > MAX_LOGS:
-        _logs.pop()
+    _logs.appendleft(log)  # Insertar al inicio (más reciente primero)
+    _counts[(source, status)] += 1
     
     return log
 
 
 def get_all_logs(limit: int = 50) -> list[ExecutionLog]:
     """Obtiene todos los logs"""
-    return _logs[:limit]
+    return list(islice(_logs, limit))
 
 
 def get_logs_by_source(source: ExecutionSource, limit: int = 50) -> list[ExecutionLog]:
     """Obtiene logs filtrados por origen"""
-    filtered = [log for log in _logs if log.source == source]
-    return filtered[:limit]
+    filtered = (log for log in _logs if log.source == source)
+    return list(islice(filtered, limit))
 
 
 def get_api_logs(limit: int = 50) -> list[ExecutionLog]:
@@ -77,28 +84,31 @@ def get_web_logs(limit: int = 50) -> list[ExecutionLog]:
 
 def get_error_logs(limit: int = 50) -> list[ExecutionLog]:
     """Obtiene solo logs con errores"""
-    filtered = [log for log in _logs if log.status == "error"]
-    return filtered[:limit]
+    filtered = (log for log in _logs if log.status == "error")
+    return list(islice(filtered, limit))
 
 
 def get_stats() -> dict:
     """Obtiene estadísticas de logs"""
-    api_logs = [l for l in _logs if l.source == ExecutionSource.API]
-    web_logs = [l for l in _logs if l.source == ExecutionSource.WEB]
-    
     return {
         "total": len(_logs),
-        "api_total": len(api_logs),
-        "api_success": sum(1 for l in api_logs if l.status == "success"),
-        "api_errors": sum(1 for l in api_logs if l.status == "error"),
-        "web_total": len(web_logs),
-        "web_success": sum(1 for l in web_logs if l.status == "success"),
-        "web_errors": sum(1 for l in web_logs if l.status == "error"),
+        "api_total": _source_total(ExecutionSource.API),
+        "api_success": _counts[(ExecutionSource.API, "success")],
+        "api_errors": _counts[(ExecutionSource.API, "error")],
+        "web_total": _source_total(ExecutionSource.WEB),
+        "web_success": _counts[(ExecutionSource.WEB, "success")],
+        "web_errors": _counts[(ExecutionSource.WEB, "error")],
     }
 
 
+def _source_total(source: ExecutionSource) -> int:
+    """Total de logs de un origen (cualquier status)"""
+    return sum(count for (log_source, _), count in _counts.items() if log_source == source)
+
+
 def clear_logs() -> int:
     """Limpia todos los logs"""
     count = len(_logs)
     _logs.clear()
+    _counts.clear()
     return count
@@ -1,19 +1,51 @@
 """
 Servicio de almacenamiento en Supabase con soporte para archivos grandes (TUS)
 """
+import mmap
 import re
 import base64
+import logging
+import socket
 import time
 import requests
+from functools import lru_cache
 from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
 from urllib3.util.retry import Retry
-from datetime import datetime
 from pathlib import Path
 from typing import Optional
-from supabase import create_client, Client
+from supabase import AsyncClient, Client, acreate_client, create_client
 from ..config import get_settings
 
+logger = logging.getLogger(__name__)
+
 _client: Optional[Client] = None
+_async_client: Optional[AsyncClient] = None
+_http_session: Optional[requests.Session] = None
+
+# Content-Type por formato de audio (se construye una sola vez al cargar el módulo)
+AUDIO_CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "m4a": "audio/mp4",
+    "wav": "audio/wav",
+    "opus": "audio/opus",
+}
+DEFAULT_CONTENT_TYPE = "audio/mpeg"
+
+# Patrones de sanitize_filename (compilados una vez)
+_UNSAFE_CHARS_RE = re.compile(r'[^a-zA-Z0-9_\-.]')
+_UNDERSCORES_RE = re.compile(r'_+')
+
+# Timeouts (conexión, lectura) por fase: un host caído falla en segundos
+# sin acortar el tiempo que el servidor tiene para responder a un chunk
+CONNECT_TIMEOUT = 15
+UPLOAD_TIMEOUT = (CONNECT_TIMEOUT, 120)  # 2 minutos por upload/chunk
+CONTROL_TIMEOUT = (CONNECT_TIMEOUT, 30)  # Creación y HEAD de TUS
+
+# Límites del tamaño de chunk adaptativo de TUS
+TUS_MIN_CHUNK_SIZE = 1024 * 1024  # 1MB
+TUS_MAX_CHUNK_SIZE = 32 * 1024 * 1024  # 32MB
+TUS_FAST_CHUNK_SECONDS = 5  # Chunk más rápido que esto: duplicar el tamaño
 
 
 def get_supabase_client() -> Client:
@@ -34,16 +66,74 @@ def get_supabase_client() -> Client:
     return _client
 
 
+async def get_async_supabase_client() -> AsyncClient:
+    """
+    Cliente async de Supabase (singleton) para la tabla jobs:
+    las consultas usan httpx async y no ocupan hilos del threadpool.
+    """
+    global _async_client
+    
+    if _async_client is None:
+        settings = get_settings()
+        
+        if not settings.supabase_url or not settings.supabase_key:
+            raise ValueError(
+                "Supabase no configurado. "
+                "Define SUPABASE_URL y SUPABASE_KEY en las variables de entorno."
+            )
+        
+        _async_client = await acreate_client(settings.supabase_url, settings.supabase_key)
+    
+    return _async_client
+
+
+async def close_async_supabase_client() -> None:
+    """Cierra las conexiones HTTP del cliente async (shutdown)"""
+    global _async_client
+    
+    if _async_client is not None:
+        await _async_client.postgrest.aclose()
+        _async_client = None
+
+
 def sanitize_filename(filename: str) -> str:
     """Elimina caracteres no permitidos del nombre de archivo"""
-    sanitized = re.sub(r'[^a-zA-Z0-9_\-.]', '_', filename)
-    sanitized = re.sub(r'_+', '_', sanitized)
+    sanitized = _UNSAFE_CHARS_RE.sub('_', filename)
+    sanitized = _UNDERSCORES_RE.sub('_', sanitized)
     return sanitized.strip('_')[:80]
 
 
+def get_content_type(audio_format: str) -> str:
+    """Content-Type para un formato de audio (mp3, m4a, wav, opus)"""
+    return AUDIO_CONTENT_TYPES.get(audio_format, DEFAULT_CONTENT_TYPE)
+
+
 def _b64encode(s: str) -> str:
     """Encode string to base64 for TUS metadata"""
-    return base64.b64encode(s.encode()).decode()
+    return base64.b64encode(s.encode()).decode("ascii")
+
+
+@lru_cache(maxsize=128)
+def _tus_metadata_prefix(bucket: str, content_type: str) -> str:
+    """Parte fija del Upload-Metadata de TUS (el orden de los pares no importa)"""
+    return f"bucketName {_b64encode(bucket)},contentType {_b64encode(content_type)},"
+
+
+# Sockets de la sesión de uploads: sin Nagle (ya es el default de urllib3), buffer de
+# envío grande para chunks de varios MB con RTT alto y keep-alive a nivel TCP
+_UPLOAD_SOCKET_OPTIONS = [
+    *HTTPConnection.default_socket_options,
+    (socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+
+class _UploadAdapter(HTTPAdapter):
+    """HTTPAdapter que abre las conexiones con _UPLOAD_SOCKET_OPTIONS"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = _UPLOAD_SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
 
 
 def _create_http_session() -> requests.Session:
@@ -58,10 +148,11 @@ def _create_http_session() -> requests.Session:
         allowed_methods=["HEAD", "GET", "POST", "PATCH"],
     )
     
-    adapter = HTTPAdapter(
+    # Compartida entre jobs: varios uploads concurrentes al mismo host
+    adapter = _UploadAdapter(
         max_retries=retry_strategy,
-        pool_connections=1,
-        pool_maxsize=1,
+        pool_connections=4,
+        pool_maxsize=8,
     )
     
     session.mount('https://', adapter)
@@ -70,7 +161,66 @@ def _create_http_session() -> requests.Session:
     return session
 
 
-def upload_file(file_path: Path, folder: str = "audio") -> str:
+def get_http_session() -> requests.Session:
+    """
+    Sesión HTTP compartida (singleton) para Storage: las conexiones keep-alive
+    se reutilizan entre uploads y entre los PATCH de TUS, sin un handshake TLS por request.
+    """
+    global _http_session
+    
+    if _http_session is None:
+        _http_session = _create_http_session()
+    
+    return _http_session
+
+
+def close_http_session() -> None:
+    """Cierra las conexiones de la sesión HTTP compartida (shutdown)"""
+    global _http_session
+    
+    if _http_session is not None:
+        _http_session.close()
+        _http_session = None
+
+
+def warm_up_http_session() -> None:
+    """
+    Abre por adelantado la conexión keep-alive con Storage (best-effort): el upload
+    posterior reutiliza la conexión sin pagar el handshake TCP+TLS.
+    """
+    try:
+        get_http_session().head(_public_url_prefix(), timeout=5)
+    except Exception as e:
+        logger.debug("Warm-up de Storage falló: %s", e)
+
+
+def build_storage_path(file_path: Path, folder: str = "audio") -> str:
+    """Genera la ruta del archivo dentro del bucket"""
+    # Nanosegundos en hex: ordenable y sin choques entre uploads del mismo segundo (x-upsert)
+    timestamp = f"{time.time_ns():x}"
+    safe_name = sanitize_filename(file_path.name)
+    return f"{folder}/{timestamp}_{safe_name}"
+
+
+@lru_cache(maxsize=1)
+def _public_url_prefix() -> str:
+    """Prefijo de las URLs públicas del bucket (la configuración no cambia en ejecución)"""
+    settings = get_settings()
+    return f"{settings.supabase_url}/storage/v1/object/public/{settings.supabase_bucket}/"
+
+
+@lru_cache(maxsize=1)
+def _bearer_auth() -> str:
+    """Header Authorization para Storage, construido una sola vez"""
+    return f"Bearer {get_settings().supabase_key}"
+
+
+def get_public_url(storage_path: str) -> str:
+    """URL pública de un archivo del bucket (se conoce antes de terminar el upload)"""
+    return _public_url_prefix() + storage_path
+
+
+def upload_file(file_path: Path, folder: str = "audio", storage_path: Optional[str] = None) -> str:
     """
     Sube archivo a Supabase Storage.
     Usa TUS (resumable) para archivos > 4MB, upload directo para menores.
@@ -79,86 +229,80 @@ def upload_file(file_path: Path, folder: str = "audio") -> str:
     
     # Usar TUS para archivos > 4MB
     if file_size > 4 * 1024 * 1024:
-        return upload_file_tus(file_path, folder)
+        return upload_file_tus(file_path, folder, storage_path=storage_path)
     else:
-        return upload_file_direct(file_path, folder)
+        return upload_file_direct(file_path, folder, storage_path=storage_path)
 
 
-def upload_file_direct(file_path: Path, folder: str = "audio") -> str:
-    """Upload directo para archivos pequeños (< 4MB)"""
+def upload_file_direct(file_path: Path, folder: str = "audio", storage_path: Optional[str] = None) -> str:
+    """
+    Upload directo para archivos pequeños (< 4MB).
+    Envía el archivo en streaming a la API REST de Storage, sin cargarlo en memoria.
+    """
     settings = get_settings()
-    client = get_supabase_client()
     
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_name = sanitize_filename(file_path.name)
-    storage_path = f"{folder}/{timestamp}_{safe_name}"
-    
-    extension = file_path.suffix.lower()[1:]
-    content_types = {
-        "mp3": "audio/mpeg",
-        "m4a": "audio/mp4",
-        "wav": "audio/wav",
-        "opus": "audio/opus",
+    storage_path = storage_path or build_storage_path(file_path, folder)
+    
+    content_type = get_content_type(file_path.suffix.lower()[1:])
+    
+    upload_url = f"{settings.supabase_url}/storage/v1/object/{settings.supabase_bucket}/{storage_path}"
+    headers = {
+        "Authorization": _bearer_auth(),
+        "apikey": settings.supabase_key,
+        "Content-Type": content_type,
+        "x-upsert": "true",
     }
-    content_type = content_types.get(extension, "audio/mpeg")
     
+    session = get_http_session()
     with open(file_path, "rb") as f:
-        file_data = f.read()
-    
-    client.storage.from_(settings.supabase_bucket).upload(
-        path=storage_path,
-        file=file_data,
-        file_options={"content-type": content_type}
-    )
+        response = session.post(upload_url, headers=headers, data=f, timeout=UPLOAD_TIMEOUT)
     
-    public_url = client.storage.from_(settings.supabase_bucket).get_public_url(storage_path)
+    if response.status_code not in [200, 201]:
+        raise Exception(f"Error subiendo archivo: {response.status_code} - {response.text}")
     
-    return public_url
+    return get_public_url(storage_path)
 
 
-def upload_file_tus(file_path: Path, folder: str = "audio", max_retries: int = 5) -> str:
+def upload_file_tus(
+    file_path: Path,
+    folder: str = "audio",
+    max_retries: int = 5,
+    storage_path: Optional[str] = None,
+) -> str:
     """
     Upload resumible (TUS) para archivos grandes (> 4MB).
-    Sube en chunks de 3MB con reintentos automáticos.
+    Sube en chunks adaptativos (settings.supabase_tus_chunk_mb al inicio) con reintentos automáticos.
     """
     settings = get_settings()
     
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_name = sanitize_filename(file_path.name)
-    storage_path = f"{folder}/{timestamp}_{safe_name}"
+    storage_path = storage_path or build_storage_path(file_path, folder)
     
     file_size = file_path.stat().st_size
     file_size_mb = file_size / (1024 * 1024)
     
-    print(f"📤 Subiendo {file_path.name} ({file_size_mb:.1f}MB) usando TUS...")
+    logger.info("📤 Subiendo %s (%.1fMB) usando TUS...", file_path.name, file_size_mb)
     
     # Detectar content type
-    extension = file_path.suffix.lower()[1:]
-    content_types = {
-        "mp3": "audio/mpeg",
-        "m4a": "audio/mp4",
-        "wav": "audio/wav",
-        "opus": "audio/opus",
-    }
-    content_type = content_types.get(extension, "audio/mpeg")
+    content_type = get_content_type(file_path.suffix.lower()[1:])
     
-    # Crear sesión HTTP
-    session = _create_http_session()
+    # Sesión HTTP compartida (keep-alive) y header de auth, fuera del loop de chunks
+    session = get_http_session()
+    auth = _bearer_auth()
     
     # Paso 1: Crear upload session
     tus_url = f"{settings.supabase_url}/storage/v1/upload/resumable"
     
     headers = {
-        "Authorization": f"Bearer {settings.supabase_key}",
+        "Authorization": auth,
         "x-upsert": "true",
         "Upload-Length": str(file_size),
-        "Upload-Metadata": f"bucketName {_b64encode(settings.supabase_bucket)},objectName {_b64encode(storage_path)},contentType {_b64encode(content_type)}",
+        "Upload-Metadata": f"{_tus_metadata_prefix(settings.supabase_bucket, content_type)}objectName {_b64encode(storage_path)}",
         "Tus-Resumable": "1.0.0",
     }
     
     for attempt in range(max_retries):
         try:
-            response = session.post(tus_url, headers=headers, timeout=30)
+            response = session.post(tus_url, headers=headers, timeout=CONTROL_TIMEOUT)
             
             if response.status_code == 201:
                 break
@@ -176,34 +320,51 @@ def upload_file_tus(file_path: Path, folder: str = "audio", max_retries: int = 5
     if not upload_url:
         raise Exception("No se recibió Location header de TUS")
     
-    # Paso 2: Subir en chunks de 3MB (más pequeños para evitar timeouts)
-    chunk_size = 3 * 1024 * 1024  # 3MB
+    # Paso 2: Subir en chunks de tamaño adaptativo: se duplica si el chunk subió rápido
+    # al primer intento y se reduce a la mitad en cada reintento (timeouts, 5xx)
+    chunk_size = settings.supabase_tus_chunk_mb * 1024 * 1024
     offset = 0
     
-    with open(file_path, "rb") as f:
+    # Headers del PATCH (solo Upload-Offset y Content-Length cambian por chunk) y del HEAD
+    patch_headers = {
+        "Authorization": auth,
+        "Content-Type": "application/offset+octet-stream",
+        "Tus-Resumable": "1.0.0",
+    }
+    head_headers = {
+        "Authorization": auth,
+        "Tus-Resumable": "1.0.0",
+    }
+    
+    # El archivo se mapea en memoria: cada chunk es un memoryview sobre el mmap que
+    # requests envía sin copiarlo al heap de Python. Mientras un PATCH está en vuelo
+    # (TUS solo admite uno a la vez por upload) el kernel lee por adelantado el siguiente,
+    # y las páginas ya confirmadas se sueltan para que el RSS no crezca con el archivo.
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+        
         while offset < file_size:
-            f.seek(offset)
-            chunk = f.read(chunk_size)
-            chunk_len = len(chunk)
+            next_offset = offset + chunk_size
+            if next_offset < file_size:
+                mm.madvise(mmap.MADV_WILLNEED, next_offset - next_offset % mmap.PAGESIZE, chunk_size)
             
             # Reintentos para cada chunk
             chunk_uploaded = False
             for attempt in range(max_retries):
                 try:
-                    patch_headers = {
-                        "Authorization": f"Bearer {settings.supabase_key}",
-                        "Upload-Offset": str(offset),
-                        "Content-Type": "application/offset+octet-stream",
-                        "Content-Length": str(chunk_len),
-                        "Tus-Resumable": "1.0.0",
-                    }
+                    # El offset puede venir del servidor tras un reintento
+                    chunk_len = min(chunk_size, file_size - offset)
+                    patch_headers["Upload-Offset"] = str(offset)
+                    patch_headers["Content-Length"] = str(chunk_len)
                     
-                    patch_response = session.patch(
-                        upload_url,
-                        headers=patch_headers,
-                        data=chunk,
-                        timeout=120  # 2 minutos por chunk
-                    )
+                    chunk_start = time.monotonic()
+                    with memoryview(mm)[offset:offset + chunk_len] as chunk:
+                        patch_response = session.patch(
+                            upload_url,
+                            headers=patch_headers,
+                            data=chunk,
+                            timeout=UPLOAD_TIMEOUT,
+                        )
                     
                     if patch_response.status_code in [200, 204]:
                         # Éxito - actualizar offset
@@ -213,8 +374,13 @@ def upload_file_tus(file_path: Path, folder: str = "audio", max_retries: int = 5
                         else:
                             offset += chunk_len
                         
+                        mm.madvise(mmap.MADV_DONTNEED, 0, offset - offset % mmap.PAGESIZE)
+                        
+                        if attempt == 0 and time.monotonic() - chunk_start < TUS_FAST_CHUNK_SECONDS:
+                            chunk_size = min(chunk_size * 2, TUS_MAX_CHUNK_SIZE)
+                        
                         progress = (offset / file_size) * 100
-                        print(f"   Progreso: {progress:.1f}% ({offset}/{file_size} bytes)")
+                        logger.debug("   Progreso: %.1f%% (%s/%s bytes)", progress, offset, file_size)
                         chunk_uploaded = True
                         break
                     else:
@@ -222,7 +388,8 @@ def upload_file_tus(file_path: Path, folder: str = "audio", max_retries: int = 5
                         
                 except (requests.exceptions.RequestException, Exception) as e:
                     if attempt < max_retries - 1:
-                        print(f"⚠️  Reintentando chunk (intento {attempt + 1}/{max_retries})...")
+                        logger.warning("⚠️  Reintentando chunk (intento %s/%s)...", attempt + 1, max_retries)
+                        chunk_size = max(chunk_size // 2, TUS_MIN_CHUNK_SIZE)
                         wait_time = min(2 ** attempt, 30)
                         time.sleep(wait_time)
                         
@@ -230,45 +397,48 @@ def upload_file_tus(file_path: Path, folder: str = "audio", max_retries: int = 5
                         try:
                             head_response = session.head(
                                 upload_url,
-                                headers={
-                                    "Authorization": f"Bearer {settings.supabase_key}",
-                                    "Tus-Resumable": "1.0.0",
-                                },
-                                timeout=15
+                                headers=head_headers,
+                                timeout=CONTROL_TIMEOUT,
                             )
                             if head_response.status_code == 200:
                                 server_offset = head_response.headers.get("Upload-Offset")
                                 if server_offset:
                                     offset = int(server_offset)
-                                    f.seek(offset)
                         except:
                             pass
                         continue
                     else:
-                        print(f"❌ Error subiendo chunk después de {max_retries} intentos")
+                        logger.error("❌ Error subiendo chunk después de %s intentos", max_retries)
                         raise Exception(f"Error subiendo chunk offset {offset} después de {max_retries} intentos: {str(e)}")
             
             if not chunk_uploaded:
                 raise Exception(f"No se pudo subir chunk en offset {offset}")
     
-    session.close()
-    
-    # Construir URL pública
-    public_url = f"{settings.supabase_url}/storage/v1/object/public/{settings.supabase_bucket}/{storage_path}"
-    print(f"✅ Archivo subido exitosamente: {storage_path}")
-    return public_url
+    logger.info("✅ Archivo subido exitosamente: %s", storage_path)
+    return get_public_url(storage_path)
 
 
 def delete_file(storage_path: str) -> bool:
     """Elimina archivo del storage"""
+    return delete_files([storage_path]) is not None
+
+
+def delete_files(storage_paths: list[str]) -> Optional[int]:
+    """
+    Elimina varios archivos del storage en un solo request.
+    Devuelve cuántos se eliminaron, o None si el request falló.
+    """
+    if not storage_paths:
+        return 0
+    
     settings = get_settings()
     client = get_supabase_client()
     
     try:
-        client.storage.from_(settings.supabase_bucket).remove([storage_path])
-        return True
+        removed = client.storage.from_(settings.supabase_bucket).remove(storage_paths)
+        return len(removed)
     except Exception:
-        return False
+        return None
 
 
 def is_configured() -> bool:
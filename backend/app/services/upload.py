@@ -1,28 +1,97 @@
 """
 Servicio de extracción de audio desde archivos de video subidos
 """
+import os
+import asyncio
+import queue
+import re
+import shutil
+import tempfile
+import threading
 import uuid
 import subprocess
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Optional
+
+import aiofiles
+from python_multipart.multipart import MultipartParser, parse_options_header
 
 from ..config import get_settings
 from ..models import AudioFormat, AudioQuality
+from .video import cleanup_file as _remove_file, format_file_size
 
 
 TEMP_DIR = Path("/tmp/video-to-audio")
 TEMP_DIR.mkdir(parents=True, exist_ok=True)
 
+# Tamaño máximo de video en bytes (la configuración no cambia en ejecución)
+MAX_UPLOAD_BYTES = get_settings().max_file_size_mb * 1024 * 1024
+
+# Salida de FFmpeg: solo la primera pista de audio (los demás streams no se decodifican)
+_FFMPEG_AUDIO_OUTPUT_ARGS = ["-vn", "-map", "0:a:0?"]
+
+# Duración de la entrada que FFmpeg informa en stderr ("Duration: 00:03:25.48")
+_FFMPEG_DURATION_RE = re.compile(r"Duration: (\d+):(\d{2}):(\d{2})")
+
+
+class FileTooLargeError(ValueError):
+    """El video supera settings.max_file_size_mb"""
+    
+    def __init__(self, size_bytes: int, partial: bool = False):
+        settings = get_settings()
+        self.size_bytes = size_bytes
+        super().__init__(
+            f"Archivo muy grande ({format_file_size(size_bytes)}{'+' if partial else ''}). "
+            f"Máximo permitido: {settings.max_file_size_mb}MB"
+        )
+
+
 # Formatos de video soportados
-SUPPORTED_VIDEO_FORMATS = {
+SUPPORTED_VIDEO_FORMATS = frozenset({
     ".mp4", ".mkv", ".webm", ".avi", ".mov", ".flv", ".wmv", ".m4v", ".mpeg", ".mpg", ".3gp"
+})
+# Las mismas extensiones sin el punto, para validar con rpartition sin construir un Path
+_VIDEO_EXTENSIONS = frozenset(ext[1:] for ext in SUPPORTED_VIDEO_FORMATS)
+
+# Content-Types de video aceptados aunque la extensión no se reconozca
+ACCEPTED_VIDEO_MIME_TYPES = {
+    "video/mp4", "video/webm", "video/x-matroska", "video/quicktime", "video/x-msvideo",
+    "video/x-flv", "video/x-ms-wmv", "video/x-m4v", "video/mpeg", "video/3gpp",
 }
 
+# Content-Types genéricos (el cliente no conoce el tipo): decide la extensión
+GENERIC_MIME_TYPES = {"application/octet-stream", "binary/octet-stream"}
+
+# Contenedores que FFmpeg puede leer desde un pipe (sin seek).
+# MP4/MOV/M4V/3GP pueden tener el índice (moov) al final y necesitan el archivo en disco.
+STREAMABLE_VIDEO_FORMATS = {".mkv", ".webm", ".flv", ".mpeg", ".mpg"}
+
 
 def is_valid_video_file(filename: str) -> bool:
     """Verifica si el archivo es un formato de video soportado"""
+    _, dot, ext = filename.rpartition(".")
+    return bool(dot) and ext.lower() in _VIDEO_EXTENSIONS
+
+
+def is_valid_video_upload(filename: Optional[str], content_type: Optional[str] = None) -> bool:
+    """
+    Valida un upload por extensión y Content-Type, antes de leer su contenido.
+    Un Content-Type que no es de video (ej: image/png) se rechaza aunque la extensión
+    sea válida; un Content-Type de video aceptado basta si la extensión no se reconoce.
+    """
+    mime = (content_type or "").split(";")[0].strip().lower()
+    
+    if mime and mime not in GENERIC_MIME_TYPES and not mime.startswith("video/"):
+        return False
+    
+    return bool(filename) and (is_valid_video_file(filename) or mime in ACCEPTED_VIDEO_MIME_TYPES)
+
+
+def is_streamable_video_file(filename: str) -> bool:
+    """Verifica si el contenedor se puede extraer leyendo desde un pipe"""
     ext = Path(filename).suffix.lower()
-    return ext in SUPPORTED_VIDEO_FORMATS
+    return ext in STREAMABLE_VIDEO_FORMATS
 
 
 def get_video_duration(file_path: Path) -> Optional[int]:
@@ -47,13 +116,55 @@ def get_video_duration(file_path: Path) -> Optional[int]:
     return None
 
 
+def _parse_ffmpeg_duration(stderr: str) -> Optional[int]:
+    """Duración en segundos de la entrada según el stderr de FFmpeg (None si es N/A)"""
+    match = _FFMPEG_DURATION_RE.search(stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = map(int, match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def _build_output_path(stem: str, output_format: AudioFormat, directory: Path = TEMP_DIR) -> Path:
+    """Genera la ruta de salida del audio (por defecto en TEMP_DIR)"""
+    unique_id = str(uuid.uuid4())[:8]
+    stem = stem[:50]  # Limitar longitud del nombre
+    return directory / f"{unique_id}_{stem}.{output_format.value}"
+
+
+def _output_dir_for(input_file: Path) -> Path:
+    """
+    Directorio del audio extraído: junto al video si está en el tmpfs de uploads
+    (la reserva de create_temp_video_file cubre video + audio hasta el cleanup_file
+    del video), si no TEMP_DIR. Así el audio no pasa por disco entre FFmpeg y el
+    upload a Storage.
+    """
+    if input_file.parent == Path(get_settings().upload_temp_dir):
+        return input_file.parent
+    return TEMP_DIR
+
+
+def _build_codec_args(output_format: AudioFormat, quality: AudioQuality) -> list[str]:
+    """Argumentos de codec de FFmpeg según formato"""
+    if output_format == AudioFormat.MP3:
+        return ["-codec:a", "libmp3lame", "-b:a", f"{quality.value}k"]
+    elif output_format == AudioFormat.M4A:
+        return ["-codec:a", "aac", "-b:a", f"{quality.value}k"]
+    elif output_format == AudioFormat.WAV:
+        return ["-codec:a", "pcm_s16le"]
+    elif output_format == AudioFormat.OPUS:
+        return ["-codec:a", "libopus", "-b:a", f"{quality.value}k"]
+    return []
+
+
 def extract_audio_from_file(
     input_file: Path,
     output_format: AudioFormat = AudioFormat.MP3,
     quality: AudioQuality = AudioQuality.MEDIUM,
-) -> Path:
+) -> tuple[Path, Optional[int]]:
     """
-    Extrae audio de un archivo de video usando FFmpeg.
+    Extrae audio de un archivo de video usando FFmpeg (y valida su duración
+    sin un ffprobe previo).
     
     Args:
         input_file: Ruta al archivo de video
@@ -61,62 +172,87 @@ def extract_audio_from_file(
         quality: Calidad del audio (128, 192, 256, 320 kbps)
     
     Returns:
-        Path al archivo de audio generado
+        (Path al archivo de audio generado, duración en segundos)
     """
     settings = get_settings()
+    max_seconds = settings.max_duration_minutes * 60
     
-    # Verificar duración
-    duration = get_video_duration(input_file)
-    if duration and duration > settings.max_duration_minutes * 60:
-        raise ValueError(
-            f"Video muy largo ({duration // 60} min). "
-            f"Máximo permitido: {settings.max_duration_minutes} min"
-        )
-    
-    # Generar nombre de salida
-    unique_id = str(uuid.uuid4())[:8]
-    stem = input_file.stem[:50]  # Limitar longitud del nombre
-    output_file = TEMP_DIR / f"{unique_id}_{stem}.{output_format.value}"
+    output_file = _build_output_path(input_file.stem, output_format, _output_dir_for(input_file))
+    codec_args = _build_codec_args(output_format, quality)
     
-    # Configurar codec según formato
-    codec_args = []
-    if output_format == AudioFormat.MP3:
-        codec_args = ["-codec:a", "libmp3lame", "-b:a", f"{quality.value}k"]
-    elif output_format == AudioFormat.M4A:
-        codec_args = ["-codec:a", "aac", "-b:a", f"{quality.value}k"]
-    elif output_format == AudioFormat.WAV:
-        codec_args = ["-codec:a", "pcm_s16le"]
-    elif output_format == AudioFormat.OPUS:
-        codec_args = ["-codec:a", "libopus", "-b:a", f"{quality.value}k"]
-    
-    # Ejecutar FFmpeg
+    # Ejecutar FFmpeg. Sin ffprobe previo: la duración sale del stderr de FFmpeg
+    # y -t corta la conversión de un video demasiado largo apenas pasa el máximo
     cmd = [
         "ffmpeg",
+        "-hide_banner",
+        "-nostdin",
         "-i", str(input_file),
-        "-vn",  # Sin video
+        "-t", str(max_seconds + 1),
+        *_FFMPEG_AUDIO_OUTPUT_ARGS,
         "-y",   # Sobrescribir
         *codec_args,
         str(output_file)
     ]
     
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=600  # 10 minutos máximo
+            errors="replace",
         )
+        timed_out = threading.Event()
+        
+        def _on_timeout():
+            timed_out.set()
+            proc.kill()
+        
+        watchdog = threading.Timer(600, _on_timeout)  # 10 minutos máximo
+        watchdog.start()
+        stderr_lines = []
+        duration = None
+        try:
+            # stderr línea a línea: FFmpeg informa la duración de la entrada antes de
+            # convertir, así un video demasiado largo se descarta sin transcodificarlo
+            for line in proc.stderr:
+                stderr_lines.append(line)
+                if duration is None:
+                    duration = _parse_ffmpeg_duration(line)
+                    if duration and duration > max_seconds:
+                        proc.kill()
+                        break
+            proc.wait()
+        finally:
+            watchdog.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stderr.close()
         
-        if result.returncode != 0:
-            raise RuntimeError(f"FFmpeg error: {result.stderr}")
+        if timed_out.is_set():
+            raise RuntimeError("Timeout: La extracción tardó demasiado")
         
-        if not output_file.exists():
-            raise FileNotFoundError("FFmpeg no generó el archivo de audio")
+        # Verificar duración (si FFmpeg no la informó, se mide el audio: solo puede
+        # superar el máximo si -t cortó la conversión)
+        if duration is None or duration <= max_seconds:
+            if proc.returncode != 0:
+                raise RuntimeError(f"FFmpeg error: {''.join(stderr_lines)}")
+            
+            if not output_file.exists():
+                raise FileNotFoundError("FFmpeg no generó el archivo de audio")
+            
+            if duration is None:
+                duration = get_video_duration(output_file)
         
-        return output_file
+        if duration and duration > max_seconds:
+            raise ValueError(
+                f"Video muy largo ({duration // 60} min). "
+                f"Máximo permitido: {settings.max_duration_minutes} min"
+            )
+        
+        return output_file, duration
         
-    except subprocess.TimeoutExpired:
-        raise RuntimeError("Timeout: La extracción tardó demasiado")
     except Exception as e:
         # Limpiar archivo parcial si existe
         if output_file.exists():
@@ -124,19 +260,384 @@ def extract_audio_from_file(
         raise e
 
 
-def cleanup_file(file_path: Path) -> None:
-    """Elimina un archivo temporal"""
+async def extract_audio_from_stream(
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    output_format: AudioFormat = AudioFormat.MP3,
+    quality: AudioQuality = AudioQuality.MEDIUM,
+    max_size_bytes: Optional[int] = None,
+) -> tuple[Path, int, Optional[int]]:
+    """
+    Extrae audio enviando el video directamente al stdin de FFmpeg,
+    sin escribir el video en disco.
+    
+    Args:
+        chunks: Iterador asíncrono con los bytes del video
+        filename: Nombre original del archivo (para el nombre de salida)
+        output_format: Formato de salida (mp3, m4a, wav, opus)
+        quality: Calidad del audio (128, 192, 256, 320 kbps)
+        max_size_bytes: Tamaño máximo permitido del video
+    
+    Returns:
+        (Path al archivo de audio generado, bytes de video recibidos, duración en segundos)
+    """
+    settings = get_settings()
+    max_seconds = settings.max_duration_minutes * 60
+    
+    output_file = _build_output_path(Path(filename).stem, output_format)
+    codec_args = _build_codec_args(output_format, quality)
+    
+    # Igual que extract_audio_from_file: -t corta un video demasiado largo apenas pasa
+    # el máximo, y si la entrada informa su duración FFmpeg se mata antes de convertir
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg",
+        "-hide_banner",
+        "-i", "pipe:0",
+        "-t", str(max_seconds + 1),
+        *_FFMPEG_AUDIO_OUTPUT_ARGS,
+        "-y",   # Sobrescribir
+        *codec_args,
+        str(output_file),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    input_duration = {"seconds": None, "too_long": False}
+    
+    async def _read_stderr() -> bytes:
+        """Lee stderr (FFmpeg no se bloquea con el buffer lleno) y busca la duración de la entrada"""
+        data = bytearray()
+        searching = True
+        while chunk := await proc.stderr.read(65536):
+            data += chunk
+            if not searching:
+                continue
+            duration = _parse_ffmpeg_duration(data.decode(errors="replace"))
+            # La duración sale en la cabecera de la entrada: si no está antes del mapeo es N/A
+            searching = duration is None and b"Stream mapping" not in data
+            if duration and duration > max_seconds:
+                input_duration["too_long"] = True
+                proc.kill()
+            input_duration["seconds"] = duration
+        return bytes(data)
+    
+    stderr_task = asyncio.create_task(_read_stderr())
+    total_written = 0
+    
     try:
-        if file_path and file_path.exists():
-            file_path.unlink()
-    except Exception:
-        pass
+        try:
+            async for chunk in chunks:
+                total_written += len(chunk)
+                if max_size_bytes and total_written > max_size_bytes:
+                    raise FileTooLargeError(total_written, partial=True)
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # FFmpeg terminó antes de tiempo (error, -t o duración excedida); se reporta abajo
+            pass
+        finally:
+            proc.stdin.close()
+        
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=600)  # 10 minutos máximo
+        except asyncio.TimeoutError:
+            raise RuntimeError("Timeout: La extracción tardó demasiado")
+        
+        stderr = (await stderr_task).decode(errors="replace")
+        duration = input_duration["seconds"]
+        if not input_duration["too_long"]:
+            if proc.returncode != 0:
+                raise RuntimeError(f"FFmpeg error: {stderr}")
+            
+            if not output_file.exists():
+                raise FileNotFoundError("FFmpeg no generó el archivo de audio")
+            
+            # Entrada sin duración (N/A en pipes): se mide el audio, que -t limita a max + 1
+            if duration is None:
+                duration = await asyncio.to_thread(get_video_duration, output_file)
+        
+        if duration and duration > max_seconds:
+            raise ValueError(
+                f"Video muy largo ({duration // 60} min). "
+                f"Máximo permitido: {settings.max_duration_minutes} min"
+            )
+        
+        return output_file, total_written, duration
+        
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        stderr_task.cancel()
+        # Limpiar archivo parcial si existe
+        cleanup_file(output_file)
+        raise
+
+
+# Tamaño de los bloques que MultipartUploadStream entrega (alineado con los buffers del socket)
+STREAM_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Tope de cada campo de texto y de cada header del multipart (el body puede venir chunked)
+MAX_FORM_PART_SIZE = 64 * 1024  # 64KB
+
+
+class MultipartUploadStream:
+    """
+    Lee un body multipart/form-data en streaming (request.stream()) sin pasar por
+    el spool a disco de UploadFile.
+    
+    Los campos de texto enviados antes del archivo están en `fields` al terminar
+    start(). Las partes posteriores al archivo se consumen sin guardar su contenido.
+    """
+    
+    def __init__(self, content_type: str, body: AsyncIterator[bytes], file_field: str = "file"):
+        mime, params = parse_options_header(content_type)
+        if mime != b"multipart/form-data" or not params.get(b"boundary"):
+            raise ValueError("Se esperaba un body multipart/form-data")
+        
+        self.file_field = file_field
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.fields: dict[str, str] = {}
+        
+        self._body = body.__aiter__()
+        self._body_done = False
+        self._pending: list[bytes] = []
+        self._pending_size = 0
+        self._file_done = False
+        
+        # Estado de la parte actual
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: dict[bytes, bytes] = {}
+        self._part_name: Optional[str] = None
+        self._part_is_file = False
+        self._part_skip = False
+        self._part_value: list[bytes] = []
+        self._part_size = 0
+        
+        self._parser = MultipartParser(
+            params[b"boundary"],
+            callbacks={
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+            },
+        )
+    
+    # ---- Callbacks del parser ----
+    
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._part_name = None
+        self._part_is_file = False
+        self._part_skip = False
+        self._part_value = []
+        self._part_size = 0
+    
+    def _check_header_size(self) -> None:
+        if len(self._header_field) + len(self._header_value) > MAX_FORM_PART_SIZE:
+            raise ValueError("Header del multipart demasiado grande")
+    
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+        self._check_header_size()
+    
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+        self._check_header_size()
+    
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+    
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._part_name = options.get(b"name", b"").decode("latin-1")
+        if self.filename is not None:
+            # Ya se recibió el archivo: nadie lee las partes siguientes
+            self._part_skip = True
+        elif self._part_name == self.file_field and b"filename" in options:
+            self._part_is_file = True
+            self.filename = options[b"filename"].decode("utf-8", errors="replace")
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+    
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part_is_file:
+            chunk = data[start:end]
+            self._pending.append(chunk)
+            self._pending_size += len(chunk)
+        elif not self._part_skip:
+            self._part_size += end - start
+            if self._part_size > MAX_FORM_PART_SIZE:
+                raise ValueError(f"El campo '{self._part_name}' supera el máximo de {MAX_FORM_PART_SIZE // 1024}KB")
+            self._part_value.append(data[start:end])
+    
+    def _on_part_end(self) -> None:
+        if self._part_is_file:
+            self._file_done = True
+        elif self._part_name and not self._part_skip:
+            self.fields[self._part_name] = b"".join(self._part_value).decode("utf-8", errors="replace")
+    
+    # ---- Lectura ----
+    
+    async def _feed(self) -> bool:
+        """Pasa el siguiente bloque del socket al parser. False si el body terminó"""
+        if self._body_done:
+            return False
+        try:
+            chunk = await self._body.__anext__()
+        except StopAsyncIteration:
+            self._body_done = True
+            self._parser.finalize()
+            return False
+        if chunk:
+            self._parser.write(chunk)
+        return True
+    
+    async def start(self) -> None:
+        """Lee hasta el inicio del archivo (nombre y campos previos disponibles)"""
+        while self.filename is None:
+            if not await self._feed():
+                raise ValueError(f"No se recibió ningún archivo en el campo '{self.file_field}'")
+    
+    async def iter_file(self) -> AsyncIterator[bytes]:
+        """Entrega el contenido del archivo en bloques de ~1MB y luego lee el resto del body"""
+        while True:
+            if self._pending and (self._file_done or self._pending_size >= STREAM_CHUNK_SIZE):
+                chunk = b"".join(self._pending)
+                self._pending.clear()
+                self._pending_size = 0
+                yield chunk
+            if self._file_done and not self._pending:
+                break
+            if not await self._feed():
+                if not self._file_done:
+                    raise ValueError("El upload terminó antes de recibir el archivo completo")
+        
+        # Consumir el resto del body (partes posteriores al archivo, se descartan)
+        while await self._feed():
+            pass
+
+
+async def save_stream_to_file(
+    chunks: AsyncIterator[bytes],
+    file_path: Path,
+    max_size_bytes: int,
+) -> int:
+    """
+    Escribe el stream en file_path y corta en cuanto supera max_size_bytes
+    (sin esperar a tener el archivo completo en disco).
+    
+    Returns:
+        Bytes escritos
+    """
+    total_written = 0
+    
+    async with aiofiles.open(file_path, "wb") as f:
+        async for chunk in chunks:
+            total_written += len(chunk)
+            if total_written > max_size_bytes:
+                raise FileTooLargeError(total_written, partial=True)
+            await f.write(chunk)
+    
+    return total_written
+
+
+class BufferPool:
+    """
+    Buffers (bytearray) reutilizables para copiar uploads grandes con readinto,
+    sin crear un bytes nuevo por cada chunk.
+    """
+    
+    def __init__(self, buffer_size: int, max_idle: int):
+        self.buffer_size = buffer_size
+        self._buffers: queue.LifoQueue[bytearray] = queue.LifoQueue(maxsize=max_idle)
+    
+    def acquire(self) -> bytearray:
+        """Toma un buffer libre (o crea uno si no queda ninguno)"""
+        try:
+            return self._buffers.get_nowait()
+        except queue.Empty:
+            return bytearray(self.buffer_size)
+    
+    def release(self, buffer: bytearray) -> None:
+        """Devuelve el buffer al pool (se descarta si ya hay max_idle libres)"""
+        try:
+            self._buffers.put_nowait(buffer)
+        except queue.Full:
+            pass
+
+
+# 4MB por buffer; cada copia sin sendfile usa 2 (lectura y escritura solapadas).
+# Solo lo usa el fallback, así que en reposo se guarda un único par (8MB)
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024
+receive_buffer_pool = BufferPool(RECEIVE_BUFFER_SIZE, max_idle=2)
+
+
+# Bytes del tmpfs reservados por cada video en curso (video + audio), hasta su cleanup_file.
+# Sin reserva, dos uploads simultáneos verían el mismo espacio libre y ambos llegarían a ENOSPC
+_tmpfs_reserved: dict[Path, int] = {}
+_tmpfs_lock = threading.Lock()
+
+
+def create_temp_video_file(suffix: str, expected_size: int = 0) -> Path:
+    """
+    Crea el archivo temporal para un video subido (mkstemp: sin carreras de nombres).
+    Usa el tmpfs de settings.upload_temp_dir si, descontando lo ya reservado por otros
+    uploads, tiene espacio para el video y su audio; si no TEMP_DIR en disco.
+    
+    Args:
+        suffix: Extensión del video (ej: ".mp4")
+        expected_size: Tamaño esperado en bytes (0 si se desconoce: se asume el máximo)
+    """
+    settings = get_settings()
+    
+    if expected_size > MAX_UPLOAD_BYTES:
+        raise FileTooLargeError(expected_size)
+    
+    fast_dir = Path(settings.upload_temp_dir)
+    needed = (expected_size or MAX_UPLOAD_BYTES) * 2
+    
+    with _tmpfs_lock:
+        # Reservas de archivos que ya no existen (borrados por cleanup_old_files)
+        for stale in [path for path in _tmpfs_reserved if not path.exists()]:
+            del _tmpfs_reserved[stale]
+        
+        try:
+            fast_dir.mkdir(parents=True, exist_ok=True)
+            # Conservador: lo ya escrito por los uploads en curso se descuenta dos veces
+            if shutil.disk_usage(fast_dir).free - sum(_tmpfs_reserved.values()) >= needed:
+                fd, path = tempfile.mkstemp(suffix=suffix, dir=fast_dir)
+                os.close(fd)
+                _tmpfs_reserved[Path(path)] = needed
+                return Path(path)
+        except OSError:
+            pass
+    
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=TEMP_DIR)
+    os.close(fd)
+    return Path(path)
+
+
+def cleanup_file(file_path: Path) -> None:
+    """Elimina un archivo temporal y libera su reserva en el tmpfs"""
+    if file_path:
+        with _tmpfs_lock:
+            _tmpfs_reserved.pop(file_path, None)
+    _remove_file(file_path)
+
+
+@lru_cache(maxsize=2048)
+def _format_mb(megabytes: int) -> str:
+    return f"{megabytes} MB"
 
 
-def format_file_size(bytes_size: int) -> str:
-    """Formatea tamaño de archivo"""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if bytes_size < 1024:
-            return f"{bytes_size:.1f} {unit}"
-        bytes_size /= 1024
-    return f"{bytes_size:.1f} TB"
+def format_megabytes(bytes_size: int) -> str:
+    """MB enteros para mensajes de progreso (shift en vez de divisiones, cacheado por MB)"""
+    return _format_mb(bytes_size >> 20)
@@ -1,8 +1,13 @@
 """
 Servicio de descarga y extracción de audio - VERSIÓN OPTIMIZADA 2025
 """
+import re
+import logging
+import threading
+import time
 import uuid
 import requests
+from collections import OrderedDict
 from pathlib import Path
 from typing import Callable, Optional
 from urllib.parse import urlparse
@@ -13,11 +18,27 @@ from ..config import get_settings
 from ..models import AudioFormat, AudioQuality, VideoInfo
 
 
+logger = logging.getLogger(__name__)
+
 TEMP_DIR = Path("/tmp/video-to-audio")
 TEMP_DIR.mkdir(parents=True, exist_ok=True)
 
 COOKIES_FILE = Path("/app/cookies.txt")
 
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".webm", ".avi", ".mov", ".flv", ".wmv", ".m4v", ".mpeg", ".mpg", ".3gp")
+
+# Cache en memoria de get_video_info (LRU con TTL), por id de video
+INFO_CACHE_MAX_SIZE = 4096
+INFO_CACHE_TTL = 3600  # 1 hora: títulos/duración casi nunca cambian
+_info_cache: "OrderedDict[str, tuple[float, VideoInfo]]" = OrderedDict()
+_info_cache_lock = threading.Lock()
+
+_YOUTUBE_ID_RE = re.compile(
+    r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)|youtu\.be/)([\w-]{11})",
+    re.IGNORECASE,
+)
+_VIMEO_ID_RE = re.compile(r"vimeo\.com/(?:.*/)?(\d+)", re.IGNORECASE)
+
 
 def format_duration(seconds: int) -> str:
     if not seconds:
@@ -29,30 +50,33 @@ def format_duration(seconds: int) -> str:
     return f"{minutes}:{secs:02d}"
 
 
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB")
+
+
 def format_file_size(bytes_size: int) -> str:
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if bytes_size < 1024:
-            return f"{bytes_size:.1f} {unit}"
-        bytes_size /= 1024
-    return f"{bytes_size:.1f} TB"
+    """Formatea tamaño de archivo"""
+    # Unidad por bit_length (cada unidad son 10 bits): sin loop de divisiones.
+    # Sin caché: los tamaños exactos en bytes casi nunca se repiten
+    unit = min((max(bytes_size, 1).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    return f"{bytes_size / (1 << (10 * unit)):.1f} {_SIZE_UNITS[unit]}"
 
 
 class YTDLPLogger:
     """Logger para capturar mensajes de yt-dlp"""
     def debug(self, msg):
         if msg.startswith('[debug]'):
-            print(f"[yt-dlp DEBUG] {msg}")
+            logger.debug("[yt-dlp DEBUG] %s", msg)
         else:
-            print(f"[yt-dlp] {msg}")
+            logger.info("[yt-dlp] %s", msg)
 
     def info(self, msg):
-        print(f"[yt-dlp INFO] {msg}")
+        logger.info("[yt-dlp INFO] %s", msg)
 
     def warning(self, msg):
-        print(f"[yt-dlp WARN] {msg}")
+        logger.warning("[yt-dlp WARN] %s", msg)
 
     def error(self, msg):
-        print(f"[yt-dlp ERROR] {msg}")
+        logger.error("[yt-dlp ERROR] %s", msg)
 
 
 def get_base_ydl_opts() -> dict:
@@ -92,33 +116,26 @@ def get_base_ydl_opts() -> dict:
     # Agregar cookies si existen
     if COOKIES_FILE.exists():
         opts["cookiefile"] = str(COOKIES_FILE)
-        print(f"[CONFIG] Usando cookies: {COOKIES_FILE}")
+        logger.info("[CONFIG] Usando cookies: %s", COOKIES_FILE)
     else:
-        print(f"[CONFIG] No se encontraron cookies en {COOKIES_FILE}")
+        logger.info("[CONFIG] No se encontraron cookies en %s", COOKIES_FILE)
 
     return opts
 
 
 def is_direct_file_url(url: str) -> bool:
     """Detecta si es una URL directa de archivo"""
-    video_extensions = [".mp4", ".mkv", ".webm", ".avi", ".mov", ".flv", ".wmv", ".m4v", ".mpeg", ".mpg", ".3gp"]
-    
-    # Extensión en URL
-    if any(url.lower().endswith(ext) for ext in video_extensions):
-        return True
-    
-    # URLs de Supabase Storage
-    if "supabase.co/storage" in url.lower():
-        return True
+    url = url.lower()
     
-    return False
+    # Extensión en URL o URLs de Supabase Storage
+    return url.endswith(VIDEO_EXTENSIONS) or "supabase.co/storage" in url
 
 
 def download_direct_file(url: str, output_path: Path) -> Path:
     """
     Descarga un archivo directo desde una URL
     """
-    print(f"📥 Descargando archivo directo: {url}")
+    logger.info("📥 Descargando archivo directo: %s", url)
     
     try:
         response = requests.get(url, stream=True, timeout=30)
@@ -136,9 +153,9 @@ def download_direct_file(url: str, output_path: Path) -> Path:
                     if total_size > 0:
                         progress = (downloaded / total_size) * 100
                         if progress % 10 < 1:  # Log cada 10%
-                            print(f"   📥 Descarga: {progress:.0f}%")
+                            logger.debug("   📥 Descarga: %.0f%%", progress)
         
-        print(f"✅ Descarga completada: {output_path.name}")
+        logger.info("✅ Descarga completada: %s", output_path.name)
         return output_path
         
     except requests.exceptions.RequestException as e:
@@ -168,6 +185,41 @@ def get_video_duration_from_file(file_path: Path) -> Optional[int]:
     return None
 
 
+def _info_cache_key(url: str) -> str:
+    """
+    Clave de cache: id del video, para que watch?v=, youtu.be/ y shorts/
+    del mismo video compartan la entrada
+    """
+    match = _YOUTUBE_ID_RE.search(url)
+    if match:
+        return f"youtube:{match.group(1)}"
+    match = _VIMEO_ID_RE.search(url)
+    if match:
+        return f"vimeo:{match.group(1)}"
+    return url.strip()
+
+
+def _get_cached_info(key: str) -> Optional[VideoInfo]:
+    with _info_cache_lock:
+        entry = _info_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, info = entry
+        if expires_at < time.monotonic():
+            del _info_cache[key]
+            return None
+        _info_cache.move_to_end(key)
+        return info
+
+
+def _set_cached_info(key: str, info: VideoInfo) -> None:
+    with _info_cache_lock:
+        _info_cache[key] = (time.monotonic() + INFO_CACHE_TTL, info)
+        _info_cache.move_to_end(key)
+        while len(_info_cache) > INFO_CACHE_MAX_SIZE:
+            _info_cache.popitem(last=False)
+
+
 def get_video_info(url: str) -> VideoInfo:
     """Obtiene información del video (YouTube/Vimeo o archivo directo)"""
     
@@ -184,7 +236,12 @@ def get_video_info(url: str) -> VideoInfo:
             channel=None,
         )
     
-    # YouTube/Vimeo
+    # YouTube/Vimeo (con cache, la extracción con yt-dlp tarda varios segundos)
+    cache_key = _info_cache_key(url)
+    cached = _get_cached_info(cache_key)
+    if cached is not None:
+        return cached
+    
     ydl_opts = {
         **get_base_ydl_opts(),
         "extract_flat": False,  # Obtener info completa
@@ -194,7 +251,7 @@ def get_video_info(url: str) -> VideoInfo:
         info = ydl.extract_info(url, download=False)
         duration = info.get("duration", 0) or 0
         
-        return VideoInfo(
+        video_info = VideoInfo(
             id=info.get("id", "unknown"),
             title=info.get("title", "Sin título"),
             duration_seconds=duration,
@@ -203,6 +260,9 @@ def get_video_info(url: str) -> VideoInfo:
             source=info.get("extractor", "unknown"),
             channel=info.get("channel") or info.get("uploader"),
         )
+    
+    _set_cached_info(cache_key, video_info)
+    return video_info
 
 
 def download_and_extract(
@@ -221,7 +281,7 @@ def download_and_extract(
     # CASO 1: URL DIRECTA DE ARCHIVO
     # ============================================
     if is_direct_file_url(url):
-        print(f"🔗 Procesando URL directa: {url}")
+        logger.info("🔗 Procesando URL directa: %s", url)
         
         # Descargar archivo
         filename = urlparse(url).path.split('/')[-1] or f"video_{unique_id}.mp4"
@@ -235,34 +295,24 @@ def download_and_extract(
         if progress_callback:
             progress_callback("downloading", 50)
         
-        # Obtener duración del archivo descargado
-        duration = get_video_duration_from_file(temp_video)
-        
-        # Validar duración
-        if duration and duration > settings.max_duration_minutes * 60:
-            cleanup_file(temp_video)
-            raise ValueError(
-                f"Video muy largo ({duration // 60} min). "
-                f"Máximo permitido: {settings.max_duration_minutes} min"
-            )
-        
-        # Extraer audio usando función del módulo upload
+        # Extraer audio usando función del módulo upload (valida la duración sin ffprobe previo)
         if progress_callback:
             progress_callback("extracting", 60)
         
         from . import upload
-        audio_file = upload.extract_audio_from_file(
-            temp_video,
-            output_format,
-            quality
-        )
+        try:
+            audio_file, duration = upload.extract_audio_from_file(
+                temp_video,
+                output_format,
+                quality
+            )
+        finally:
+            # Limpiar video temporal
+            cleanup_file(temp_video)
         
         if progress_callback:
             progress_callback("extracting", 90)
         
-        # Limpiar video temporal
-        cleanup_file(temp_video)
-        
         # Crear VideoInfo
         video_info = VideoInfo(
             id="direct_file",
@@ -281,7 +331,7 @@ def download_and_extract(
     # ============================================
     output_template = str(TEMP_DIR / f"{unique_id}_%(title).50s.%(ext)s")
     
-    print(f"🎬 Descargando video de {url}")
+    logger.info("🎬 Descargando video de %s", url)
     
     def progress_hook(d):
         if d["status"] == "downloading":
@@ -291,31 +341,30 @@ def download_and_extract(
             eta = d.get("eta") or 0
 
             if total > 0:
-                percent = int(downloaded / total * 100)
-                speed_kb = speed / 1024 if speed else 0
-                print(f"   📥 {percent}% | {downloaded/(1024*1024):.1f}/{total/(1024*1024):.1f} MB | {speed_kb:.0f} KB/s | ETA: {eta}s")
+                percent = int(downloaded * 100 // total)
+                logger.debug("   📥 %s%% | %s/%s MB | %s KB/s | ETA: %ss", percent, int(downloaded) >> 20, int(total) >> 20, int(speed) >> 10, eta)
 
                 if progress_callback:
                     progress_callback("downloading", int(percent * 0.5))
             else:
                 # Sin total conocido, mostrar solo bytes descargados
-                print(f"   📥 Descargado: {downloaded/(1024*1024):.2f} MB | Velocidad: {speed/1024 if speed else 0:.0f} KB/s")
+                logger.debug("   📥 Descargado: %s MB | Velocidad: %s KB/s", int(downloaded) >> 20, int(speed) >> 10)
 
         elif d["status"] == "finished":
             filename = d.get("filename", "unknown")
-            print(f"   ✅ Descarga completada: {filename}")
+            logger.info("   ✅ Descarga completada: %s", filename)
             if progress_callback:
                 progress_callback("extracting", 60)
         elif d["status"] == "error":
-            print(f"   ❌ Error en descarga: {d}")
+            logger.error("   ❌ Error en descarga: %s", d)
     
     def postprocessor_hook(d):
         if d["status"] == "started":
-            print(f"   🎵 Extrayendo audio...")
+            logger.info("   🎵 Extrayendo audio...")
             if progress_callback:
                 progress_callback("extracting", 70)
         elif d["status"] == "finished":
-            print(f"   ✅ Audio extraído")
+            logger.info("   ✅ Audio extraído")
             if progress_callback:
                 progress_callback("extracting", 90)
     
@@ -356,7 +405,7 @@ def download_and_extract(
         # Buscar el archivo de audio generado
         for file in TEMP_DIR.glob(f"{unique_id}_*"):
             if file.suffix == f".{output_format.value}":
-                print(f"✅ Proceso completado: {video_info.title}")
+                logger.info("✅ Proceso completado: %s", video_info.title)
                 return file, video_info
     
     raise FileNotFoundError("No se encontró el archivo de audio generado")
@@ -373,13 +422,15 @@ def cleanup_file(file_path: Path) -> None:
 
 def cleanup_old_files(max_age_hours: int = 1) -> int:
     """Limpia archivos antiguos del directorio temporal"""
-    import time
     count = 0
     now = time.time()
     max_age_seconds = max_age_hours * 3600
     
-    for file in TEMP_DIR.glob("*"):
-        if now - file.stat().st_mtime > max_age_seconds:
-            cleanup_file(file)
-            count += 1
+    upload_temp_dir = Path(get_settings().upload_temp_dir)
+    
+    for directory in (TEMP_DIR, upload_temp_dir):
+        for file in directory.glob("*"):
+            if now - file.stat().st_mtime > max_age_seconds:
+                cleanup_file(file)
+                count += 1
     return count
@@ -0,0 +1,206 @@
+"""
+Pool de procesos para el trabajo pesado de extracción (yt-dlp + ffmpeg),
+pools de hilos dedicados a los pasos bloqueantes de los jobs
+y cola de jobs en background atendida por tareas de larga duración
+"""
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+from ..config import configure_logging, get_settings
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+# Hilos propios para los pasos bloqueantes de los jobs, separados del pool por defecto
+# de asyncio.to_thread: una descarga larga no deja sin hilos a un upload ni viceversa
+_extract_pool: Optional[ThreadPoolExecutor] = None
+_io_pool: Optional[ThreadPoolExecutor] = None
+
+# Cola de jobs (función async + job_id + argumentos) y tareas que la consumen
+_job_queue: Optional[asyncio.Queue] = None
+_job_workers: list[asyncio.Task] = []
+
+
+def _init_worker() -> None:
+    """Inicializa cada proceso del pool (spawn no hereda la configuración de logging)"""
+    configure_logging(get_settings().debug)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Obtiene el pool de procesos (singleton, acotado al número de CPUs)"""
+    global _pool
+    
+    if _pool is None:
+        # spawn: el proceso principal ya tiene hilos (clientes HTTP, to_thread) y fork no es seguro
+        _pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    
+    return _pool
+
+
+async def run_in_process(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Ejecuta func(*args) en el pool de procesos sin bloquear el event loop.
+    func y args deben ser serializables (pickle): nada de lambdas ni callbacks locales.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), func, *args)
+
+
+def shutdown_process_pool() -> None:
+    """Detiene el pool de procesos (al apagar la aplicación)"""
+    global _pool
+    
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def get_extract_pool() -> ThreadPoolExecutor:
+    """Hilos para descarga + extracción que no pueden ir al pool de procesos (callbacks de progreso)"""
+    global _extract_pool
+    
+    if _extract_pool is None:
+        _extract_pool = ThreadPoolExecutor(
+            max_workers=min(os.cpu_count() or 1, 4),
+            thread_name_prefix="extract",
+        )
+    
+    return _extract_pool
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    """Hilos para I/O bloqueante de los jobs (info del video, ffprobe, uploads a Storage)"""
+    global _io_pool
+    
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="io")
+    
+    return _io_pool
+
+
+async def run_in_extract_thread(func: Callable[..., Any], *args: Any) -> Any:
+    """Ejecuta func(*args) en el pool de hilos de extracción"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_extract_pool(), func, *args)
+
+
+async def run_in_io_thread(func: Callable[..., Any], *args: Any) -> Any:
+    """Ejecuta func(*args) en el pool de hilos de I/O"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_pool(), func, *args)
+
+
+def shutdown_thread_pools() -> None:
+    """Detiene los pools de hilos de los jobs (al apagar la aplicación)"""
+    global _extract_pool, _io_pool
+    
+    for pool in (_extract_pool, _io_pool):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    _extract_pool = None
+    _io_pool = None
+
+
+class JobQueueFull(Exception):
+    """La cola de jobs está llena (settings.job_queue_size)"""
+
+
+_SHUTDOWN_MESSAGE = "El servidor se reinició antes de terminar el job. Intenta de nuevo"
+
+
+async def _fail_jobs_on_shutdown(job_ids: list[str]) -> None:
+    """Marca como fallidos los jobs que el shutdown deja sin terminar (si no, quedan pending)"""
+    from . import jobs
+    
+    results = await asyncio.gather(
+        *(
+            jobs.update_job(job_id, status="failed", error_code="SHUTDOWN", error_message=_SHUTDOWN_MESSAGE)
+            for job_id in job_ids
+        ),
+        return_exceptions=True,
+    )
+    for job_id, result in zip(job_ids, results):
+        if isinstance(result, Exception):
+            logger.error("❌ No se pudo marcar el job %s como fallido: %s", job_id[:8], result)
+
+
+async def _job_worker(worker_id: int) -> None:
+    """Consume jobs de la cola uno a uno hasta que se cancela la tarea"""
+    while True:
+        func, job_id, args = await _job_queue.get()
+        try:
+            await func(job_id, *args)
+        except asyncio.CancelledError:
+            # Shutdown con el job en curso: registrarlo antes de que el worker termine
+            await _fail_jobs_on_shutdown([job_id])
+            raise
+        except Exception as e:
+            # Los jobs registran sus propios errores; esto solo evita perder el worker
+            logger.error("❌ Worker %s: job sin manejar: %s", worker_id, e)
+        finally:
+            _job_queue.task_done()
+
+
+def start_job_workers() -> None:
+    """Crea la cola de jobs y lanza settings.job_workers tareas que la atienden (startup)"""
+    global _job_queue
+    
+    settings = get_settings()
+    _job_queue = asyncio.Queue(maxsize=settings.job_queue_size)
+    _job_workers.extend(
+        asyncio.create_task(_job_worker(i)) for i in range(settings.job_workers)
+    )
+
+
+def submit_job(func: Callable[..., Awaitable[Any]], job_id: str, *args: Any) -> None:
+    """
+    Encola func(job_id, *args) para que la procese un worker, desacoplado del request HTTP.
+    Si el servidor se apaga antes de terminarlo, el job queda "failed" (SHUTDOWN).
+    
+    Raises:
+        JobQueueFull: Si la cola está llena (backpressure: el cliente debe reintentar)
+    """
+    if _job_queue is None:
+        raise RuntimeError("La cola de jobs no está iniciada")
+    
+    try:
+        _job_queue.put_nowait((func, job_id, args))
+    except asyncio.QueueFull:
+        raise JobQueueFull() from None
+
+
+def is_job_queue_full() -> bool:
+    """True si no hay lugar para otro job en la cola"""
+    return _job_queue is not None and _job_queue.full()
+
+
+async def stop_job_workers() -> None:
+    """
+    Cancela los workers de la cola de jobs (shutdown). Los jobs en curso y los que
+    quedaban en la cola se marcan como fallidos (SHUTDOWN).
+    """
+    global _job_queue
+    
+    for task in _job_workers:
+        task.cancel()
+    await asyncio.gather(*_job_workers, return_exceptions=True)
+    _job_workers.clear()
+    
+    if _job_queue is not None:
+        pending = []
+        while not _job_queue.empty():
+            _, job_id, _ = _job_queue.get_nowait()
+            pending.append(job_id)
+        if pending:
+            logger.warning("⚠️ Shutdown: %s jobs en cola sin procesar", len(pending))
+            await _fail_jobs_on_shutdown(pending)
+    _job_queue = None
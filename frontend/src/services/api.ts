@@ -51,9 +51,10 @@ export const api = {
   // Upload - envía archivo de video
   uploadVideo: async (file: File, format: AudioFormat, quality: AudioQuality): Promise<UploadResponse> => {
     const formData = new FormData();
-    formData.append('file', file);
+    // format/quality antes del archivo: el backend los necesita para extraer mientras recibe el video
     formData.append('format', format);
     formData.append('quality', quality);
+    formData.append('file', file);
 
     // Crear un AbortController con timeout de 15 minutos (900000ms) para archivos grandes
     const controller = new AbortController();